@@ -0,0 +1,83 @@
+"""
+Benchmark time and memory of the per-task render context for large configurations: a deep copy of the configuration
+for every task against the shared read-only configuration with a per-task layer.
+
+Usage:
+    bench_context.py [options]
+
+Options:
+    -h, --help              Show this screen
+    -n, --tasks <int>       Number of tasks [default: 500]
+    -m, --materials <int>   Number of entries of the material table in the configuration [default: 500]
+    -s, --spectrum <int>    Number of bins of the energy spectrum in the configuration [default: 10000]
+"""
+
+import os
+import sys
+import copy
+import time
+import tracemalloc
+import docopt
+from jinja2 import Template
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from pycluster.context import RenderContext  # noqa: E402
+from pycluster.custom_filters import task_random  # noqa: E402
+
+TEMPLATE = 'iterator={{ iterator }} material={{ materials[iterator % materials|length].name }} ' \
+           'bins={{ spectrum|length }}'
+
+
+def get_config(num_materials, num_bins):
+    return {
+        'output_directory': '/tmp/pycluster-benchmark',
+        'project_name': 'benchmark',
+        'random_seed': 1234,
+        'array': {'first': 0, 'step': 1, 'last': 0},
+        'materials': [
+            {'name': 'material{:d}'.format(i), 'density': 1. + i * 1e-3, 'elements': [[1, 0.11], [8, 0.89]]}
+            for i in range(num_materials)
+        ],
+        'spectrum': [[i * 0.01, 1. / (i + 1)] for i in range(num_bins)],
+    }
+
+
+def render_deepcopy(template, config, num_tasks):
+    for iterator in range(num_tasks):
+        dictionary = copy.deepcopy(config)
+        dictionary['iterator'] = iterator
+        dictionary['cores_local'] = 1
+        dictionary['random_state'] = task_random(config['random_seed'], iterator)
+        template.render(dictionary)
+
+
+def render_layered(template, config, num_tasks):
+    context = RenderContext(config, 1)
+    for iterator in range(num_tasks):
+        template.render(context.get(iterator))
+
+
+def measure(function, template, config, num_tasks):
+    # time without tracing, as tracing memory slows down copying considerably
+    start = time.perf_counter()
+    function(template, config, num_tasks)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(template, config, min(num_tasks, 10))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(args):
+    num_tasks = int(args['--tasks'])
+    config = get_config(int(args['--materials']), int(args['--spectrum']))
+    template = Template(TEMPLATE)
+    print('{:>10s} {:>10s} {:>16s}'.format('context', 'time [s]', 'peak memory [MB]'))
+    for name, function in [('deepcopy', render_deepcopy), ('layered', render_layered)]:
+        elapsed, peak = measure(function, template, config, num_tasks)
+        print('{:>10s} {:>10.3f} {:>16.1f}'.format(name, elapsed, peak / 1e6))
+
+
+if __name__ == '__main__':
+    main(docopt.docopt(__doc__))
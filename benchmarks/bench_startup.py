@@ -0,0 +1,93 @@
+"""
+Benchmark the startup time of pycluster commands. A cold invocation has neither compiled python modules nor compiled
+templates available, a warm invocation finds both in its caches.
+
+Usage:
+    bench_startup.py [options]
+
+Options:
+    -h, --help              Show this screen
+    -r, --repeat <int>      Number of invocations of every command and cache state [default: 5]
+    -o, --output <file>     Write the results as JSON to <file>
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+import docopt
+
+PYCLUSTER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'pycluster.py'))
+
+
+def get_config(directory):
+    return {
+        'cluster': {'partition': 'local', 'max_memory': '1G', 'max_time': '1-00:00:00', 'mail': 'ALL'},
+        'executable': sys.executable,
+        'output_directory': directory,
+        'project_name': 'startup',
+        'array': {'first': 0, 'step': 1, 'last': 9},
+        'inputfile': 'Python-example.py',
+        'power': 3,
+        'random_seed': 1234
+    }
+
+
+def invoke(arguments, pycache, cache):
+    """
+    Run pycluster once with the given cache directories.
+    :return: The wall time in seconds
+    """
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache, XDG_CACHE_HOME=cache)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, PYCLUSTER] + arguments, env=env, stdin=subprocess.DEVNULL,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main(args):
+    repeat = int(args['--repeat'])
+    directory = tempfile.mkdtemp(prefix='pycluster-startup-')
+    try:
+        config_filename = os.path.join(directory, 'startup.json')
+        with open(config_filename, 'w') as out_file:
+            json.dump(get_config(directory), out_file)
+        commands = {
+            'help': ['--help'],
+            'status': ['status', config_filename],
+            'render': ['render', config_filename, '0'],
+            'run (dry)': ['run', config_filename, '--dry']
+        }
+        warm_pycache = os.path.join(directory, 'warm-pycache')
+        warm_cache = os.path.join(directory, 'warm-cache')
+        # create the run, so that render finds its configuration, and fill the warm caches
+        invoke(commands['run (dry)'], warm_pycache, warm_cache)
+
+        results = {}
+        print('{:<12} {:>12} {:>12} {:>12} {:>12}'.format('command', 'cold min', 'cold median', 'warm min',
+                                                          'warm median'))
+        for name, arguments in commands.items():
+            cold = []
+            for i in range(repeat):
+                cold_directory = tempfile.mkdtemp(dir=directory)
+                cold.append(invoke(arguments, os.path.join(cold_directory, 'pycache'),
+                                   os.path.join(cold_directory, 'cache')))
+                shutil.rmtree(cold_directory)
+            warm = [invoke(arguments, warm_pycache, warm_cache) for i in range(repeat)]
+            results[name] = {'cold': cold, 'warm': warm}
+            print('{:<12} {:>11.3f}s {:>11.3f}s {:>11.3f}s {:>11.3f}s'.format(
+                name, min(cold), statistics.median(cold), min(warm), statistics.median(warm)))
+    finally:
+        shutil.rmtree(directory)
+
+    if args['--output'] is not None:
+        with open(args['--output'], 'w') as out_file:
+            json.dump({'python': sys.version, 'repeat': repeat, 'results': results}, out_file, indent=4)
+
+
+if __name__ == '__main__':
+    main(docopt.docopt(__doc__))
@@ -0,0 +1,238 @@
+"""
+Benchmark pycluster end to end on the shipped configurations: generate the input files of a run and submit it to a
+fake slurm (sbatch, squeue and sacct on PATH), then query its status. In addition, the local executor runs the jobs of
+the Shell example. Wall time, peak memory of the pycluster process, files created and bytes written are measured. The
+results are stored as JSON, so that they can be compared between commits.
+
+Usage:
+    bench_suite.py [options]
+
+Options:
+    -h, --help                      Show this screen
+    -n, --tasks <list>              Comma separated numbers of tasks [default: 100,10000,100000]
+    -c, --configs <list>            Comma separated shipped configurations
+                                    [default: Geant4-example,Python-example,Shell-example]
+    -e, --executor-tasks <list>     Comma separated numbers of tasks run by the local executor [default: 100,1000]
+    -w, --workers <int>             Number of processes used to create the inputfiles [default: 1]
+    -m, --input-mode <str>          Input mode of the runs [default: files]
+    --tmp <dir>                     Create the output trees in <dir> (e.g. on the file system to benchmark)
+    -o, --output <file>             Write the results to <file> (default: benchmarks/results/<commit>.json)
+    --compare <file>                Compare the results with the results of an earlier benchmark
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import docopt
+from jinja2 import Template
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from pycluster.config import parse_settings  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PYCLUSTER = os.path.join(ROOT, 'pycluster.py')
+
+FAKE_SBATCH = """#!/bin/bash
+# hands out increasing job ids like sbatch --parsable
+count="$(dirname "$0")/jobid"
+jobid=$(( $(cat "$count" 2>/dev/null || echo 1000) + 1 ))
+echo "$jobid" > "$count"
+echo "$jobid;benchmark"
+"""
+
+FAKE_QUERY = """#!/bin/bash
+exit 0
+"""
+
+
+def resolve(value):
+    """
+    Replace the values which pycluster create would ask for by their defaults.
+    """
+    if isinstance(value, dict):
+        if 'default' in value:
+            return value['default']
+        return {key: resolve(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [resolve(item) for item in value]
+    return value
+
+
+def get_config(name, tasks, directory, partition, input_mode):
+    """
+    Get a shipped configuration for a run with the given number of tasks inside the temporary directory.
+    """
+    with open(os.path.join(ROOT, 'configs', name + '.json')) as in_file:
+        config = resolve(json.load(in_file))
+    config['output_directory'] = os.path.join(directory, 'output')
+    config['array'] = {'first': 0, 'step': 1, 'last': tasks - 1}
+    config['cluster']['partition'] = partition
+    config['input_mode'] = input_mode
+    config['random_seed'] = 1234
+    config['user'] = 'benchmark'
+    config['project_name'] = Template(config['project_name']).render(config)
+    if not os.path.isfile(config['executable']) and shutil.which(config['executable']) is None:
+        # the executables of the examples may not exist here, the jobs are not run anyway
+        executable = os.path.join(directory, 'executable')
+        with open(executable, 'w') as out_file:
+            out_file.write('#!/bin/bash\nexit 0\n')
+        os.chmod(executable, 0o755)
+        config['executable'] = executable
+    return config
+
+
+def setup_fakebin(directory):
+    """
+    Create fake slurm commands.
+    :return: The directory to prepend to PATH
+    """
+    fakebin = os.path.join(directory, 'fakebin')
+    os.makedirs(fakebin)
+    for command, content in [('sbatch', FAKE_SBATCH), ('squeue', FAKE_QUERY), ('sacct', FAKE_QUERY)]:
+        fname = os.path.join(fakebin, command)
+        with open(fname, 'w') as out_file:
+            out_file.write(content)
+        os.chmod(fname, 0o755)
+    return fakebin
+
+
+def invoke(arguments, env, log):
+    """
+    Run pycluster, confirming all questions.
+    :return: Wall time in seconds, peak resident memory of the pycluster process in bytes and the exit code
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, PYCLUSTER] + arguments, env=env, stdin=subprocess.PIPE,
+                               stdout=log, stderr=subprocess.STDOUT)
+    process.stdin.write(b'y\n' * 100)
+    process.stdin.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    max_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return wall, max_rss, os.waitstatus_to_exitcode(status)
+
+
+def get_tree_size(directory):
+    """
+    :return: The number of files in a directory tree and their total size in bytes
+    """
+    files = 0
+    size = 0
+    for root, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            files += 1
+            size += os.lstat(os.path.join(root, filename)).st_size
+    return files, size
+
+
+def run_scenario(name, tasks, partition, args, tmp, fakebin):
+    directory = tempfile.mkdtemp(prefix='pycluster-bench-', dir=tmp)
+    try:
+        config = get_config(name, tasks, directory, partition, args['--input-mode'])
+        config_filename = os.path.join(directory, 'config.json')
+        with open(config_filename, 'w') as out_file:
+            json.dump(config, out_file)
+        env = dict(os.environ, PATH=fakebin + os.pathsep + os.environ.get('PATH', ''))
+        with open(os.path.join(directory, 'pycluster.log'), 'wb') as log:
+            wall, max_rss, returncode = invoke(['run', config_filename, '--workers', args['--workers']], env, log)
+            if partition != 'local':
+                status_wall = invoke(['status', config_filename, '--max-age', '0'], env, log)[0]
+            else:
+                status_wall = None
+        files, size = get_tree_size(config['output_directory'])
+        if returncode != 0:
+            with open(os.path.join(directory, 'pycluster.log')) as in_file:
+                print(in_file.read()[-2000:])
+        return {
+            'config': name,
+            'tasks': tasks,
+            'partition': partition,
+            'input_mode': args['--input-mode'],
+            'workers': int(args['--workers']),
+            'wall': wall,
+            'max_rss': max_rss,
+            'files': files,
+            'bytes': size,
+            'status_wall': status_wall,
+            'returncode': returncode
+        }
+    finally:
+        shutil.rmtree(directory)
+
+
+def get_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         universal_newlines=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                        universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def print_result(result, previous=None):
+    line = '{:<16} {:>7} {:<7} {:>9.2f}s {:>8.1f}MB {:>8} {:>9.1f}MB'.format(
+        result['config'], result['tasks'], 'local' if result['partition'] == 'local' else 'slurm', result['wall'],
+        result['max_rss'] / 1e6, result['files'], result['bytes'] / 1e6)
+    if result['returncode'] != 0:
+        line += '  FAILED ({:d})'.format(result['returncode'])
+    if previous is not None:
+        line += '  wall {:+.0f}%, memory {:+.0f}%'.format(100. * (result['wall'] / previous['wall'] - 1),
+                                                           100. * (result['max_rss'] / previous['max_rss'] - 1))
+    print(line)
+
+
+def main(args):
+    settings = parse_settings()
+    partitions = [partition['name'] for partition in settings['partitions'] if partition['name'] != 'local']
+    if not partitions:
+        print('The benchmark needs a slurm partition in settings.json (any, slurm is faked).')
+        sys.exit(1)
+
+    previous = {}
+    if args['--compare'] is not None:
+        with open(args['--compare']) as in_file:
+            for result in json.load(in_file)['results']:
+                previous[(result['config'], result['tasks'], result['partition'] == 'local')] = result
+
+    scenarios = [(name, int(tasks), partitions[0]) for name in args['--configs'].split(',')
+                 for tasks in args['--tasks'].split(',')]
+    scenarios += [('Shell-example', int(tasks), 'local') for tasks in args['--executor-tasks'].split(',') if tasks]
+
+    tmp = tempfile.mkdtemp(prefix='pycluster-bench-', dir=args['--tmp'])
+    results = []
+    try:
+        fakebin = setup_fakebin(tmp)
+        print('{:<16} {:>7} {:<7} {:>10} {:>10} {:>8} {:>11}'.format('config', 'tasks', 'run', 'wall', 'peak RSS',
+                                                                      'files', 'bytes'))
+        for name, tasks, partition in scenarios:
+            result = run_scenario(name, tasks, partition, args, tmp, fakebin)
+            results.append(result)
+            print_result(result, previous.get((name, tasks, partition == 'local')))
+    finally:
+        shutil.rmtree(tmp)
+
+    commit = get_commit()
+    output = args['--output']
+    if output is None:
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', commit + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as out_file:
+        json.dump({
+            'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'cpus': os.cpu_count(),
+            'results': results
+        }, out_file, indent=4)
+    print('The results were written to {}.'.format(output))
+
+
+if __name__ == '__main__':
+    main(docopt.docopt(__doc__))
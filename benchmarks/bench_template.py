@@ -0,0 +1,83 @@
+"""
+Benchmark the generation of input files with a template compiled once against reloading the template for every task.
+
+Usage:
+    bench_template.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    -n, --tasks <list>          Comma separated numbers of tasks [default: 1000,10000,100000]
+    -t, --template <str>        Template input file to render [default: Geant4-example.mac]
+    --skip-reload-above <int>   Do not time the reload approach above this number of tasks [default: 100000]
+"""
+
+import os
+import sys
+import time
+import docopt
+from jinja2 import Environment, FileSystemLoader
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from pycluster.custom_filters import setup_filters, task_random  # noqa: E402
+
+TEMPLATE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'templates'))
+
+
+def get_config(inputfile):
+    return {
+        'output_directory': '/tmp/pycluster-benchmark',
+        'project_name': 'benchmark',
+        'inputfile': inputfile,
+        'array': {'first': 0, 'step': 1, 'last': 0},
+        'energy': 200,
+        'phantom': 'WaterPhantom',
+        'num_particles': 50000,
+        'power': 3,
+        'score_dose': True,
+        'random_seed': 1234,
+        'user': 'benchmark',
+        'cores_local': 1,
+    }
+
+
+def render_reload(config, num_tasks):
+    """
+    The former approach: the template is loaded and compiled again for every task
+    """
+    env = setup_filters(Environment(loader=FileSystemLoader(TEMPLATE_DIR), cache_size=0))
+    for iterator in range(num_tasks):
+        template = env.get_template(config['inputfile'])
+        template.render(config, iterator=iterator, random_state=task_random(config['random_seed'], iterator))
+
+
+def render_once(config, num_tasks):
+    """
+    The current approach: the template is compiled once and every task renders with its own random stream
+    """
+    env = setup_filters(Environment(loader=FileSystemLoader(TEMPLATE_DIR)))
+    template = env.get_template(config['inputfile'])
+    for iterator in range(num_tasks):
+        template.render(config, iterator=iterator, random_state=task_random(config['random_seed'], iterator))
+
+
+def timeit(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(args):
+    config = get_config(args['--template'])
+    skip_above = int(args['--skip-reload-above'])
+    print('{:>10s} {:>14s} {:>14s} {:>10s}'.format('tasks', 'reload [s]', 'once [s]', 'speedup'))
+    for num_tasks in [int(n) for n in args['--tasks'].split(',')]:
+        once = timeit(render_once, config, num_tasks)
+        if num_tasks <= skip_above:
+            reload = timeit(render_reload, config, num_tasks)
+            print('{:>10d} {:>14.3f} {:>14.3f} {:>9.1f}x'.format(num_tasks, reload, once, reload / once))
+        else:
+            print('{:>10d} {:>14s} {:>14.3f} {:>10s}'.format(num_tasks, '-', once, '-'))
+
+
+if __name__ == '__main__':
+    main(docopt.docopt(__doc__))
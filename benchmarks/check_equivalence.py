@@ -0,0 +1,120 @@
+"""
+Check that optimized code paths give the same results as the plain ones they replace: input files rendered at
+runtime from the compiled templates of a run against input files rendered in advance, also for templates which
+include, import or extend other templates, and the cached readtxt filter against reading the whole file in text mode
+(for all kinds of line ends).
+
+Usage:
+    check_equivalence.py [options]
+
+Options:
+    -h, --help              Show this screen
+    -n, --tasks <int>       Number of tasks to compare [default: 20]
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import docopt
+from jinja2 import Environment, DictLoader
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from pycluster.custom_filters import setup_filters  # noqa: E402
+from pycluster.filecache import FileCache  # noqa: E402
+from pycluster.context import RenderContext  # noqa: E402
+from pycluster.generate import compile_template, get_frozen_template  # noqa: E402
+
+TEMPLATES = {
+    'main.txt': '{% extends "base.inc" %}{% import "macros.inc" as macros with context %}'
+                '{% block body %}{% include "part.inc" %} {{ macros.line(iterator) }}{% endblock %}',
+    'base.inc': 'power {{ power }}: {% block body %}{% endblock %} seed {{ 100 | randomint }}\n',
+    'part.inc': 'job {{ iterator }}',
+    'macros.inc': '{% macro line(i) %}{{ i ** power }}{% endmacro %}'
+}
+
+
+def get_config(directory, num_tasks):
+    return {
+        'output_directory': directory,
+        'project_name': 'equivalence',
+        'inputfile': 'main.txt',
+        'array': {'first': 0, 'step': 1, 'last': num_tasks - 1},
+        'power': 3,
+        'random_seed': 1234
+    }
+
+
+def check_runtime(num_tasks):
+    """
+    Input files rendered in advance (files mode) and at runtime (runtime mode) must be identical.
+    """
+    directory = tempfile.mkdtemp(prefix='pycluster-equivalence-')
+    try:
+        config = get_config(directory, num_tasks)
+        env = setup_filters(Environment(loader=DictLoader(TEMPLATES)))
+        compile_template(env, config['inputfile'], os.path.join(directory, config['project_name'], 'bash',
+                                                                'templates'))
+        files = env.get_template(config['inputfile'])
+        runtime = get_frozen_template(config)
+        context = RenderContext(config, 1)
+        mismatches = [iterator for iterator in range(num_tasks)
+                      if files.render(context.get(iterator)) != runtime.render(context.get(iterator))]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return mismatches
+
+
+def readtxt_textmode(arg):
+    """
+    The former readtxt filter, which read the whole file in text mode for every call
+    """
+    if type(arg) is not list:
+        arg = [arg]
+    with open(arg[0], 'r') as fp:
+        lines = fp.readlines()
+        if len(arg) == 2:
+            return lines[arg[1]-1]
+        else:
+            return ' '.join(lines)
+
+
+def check_readtxt(num_tasks):
+    """
+    The cached readtxt filter must return the same lines as reading the file in text mode, which ends lines at a
+    newline, a carriage return or both.
+    """
+    contents = [b'a\nb\nc\n', b'a\r\nb\r\nc', b'x\ry\nz\n', b'\r\r\n\n\rlast', b'single', b'\n']
+    directory = tempfile.mkdtemp(prefix='pycluster-equivalence-')
+    mismatches = []
+    try:
+        cache = FileCache()
+        for i, content in enumerate(contents):
+            fname = os.path.join(directory, 'file{:d}.txt'.format(i))
+            with open(fname, 'wb') as out_file:
+                out_file.write(content)
+            with open(fname) as in_file:
+                num_lines = len(in_file.readlines())
+            calls = [fname] + [[fname, number] for number in range(1 - num_lines, num_lines + 1)]
+            for arg in calls:
+                expected = readtxt_textmode(arg)
+                result = cache.read(arg) if isinstance(arg, str) else cache.readline(*arg)
+                if result != expected:
+                    mismatches.append((content, arg if isinstance(arg, str) else arg[1], result, expected))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return mismatches
+
+
+def main(args):
+    num_tasks = int(args['--tasks'])
+    failed = False
+    for name, check in [('runtime mode', check_runtime), ('readtxt', check_readtxt)]:
+        mismatches = check(num_tasks)
+        print('{:<20s} {}'.format(name, 'identical' if not mismatches else 'differs for {}'.format(mismatches)))
+        failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(docopt.docopt(__doc__))
@@ -4,34 +4,133 @@ PyCluster is an application to conveniently schedule jobs to a slurm cluster.
 Usage:
     pycluster.py create <config-type>
     pycluster.py run <config> [options]
+    pycluster.py campaign <configs>... [options]
+    pycluster.py resume <config> [options]
+    pycluster.py status <config> [options]
+    pycluster.py collect <config> [options]
+    pycluster.py stats <config> [options]
     pycluster.py interactive <partition>
+    pycluster.py render <config> <index> [--output <file>]
+    pycluster.py extract <config> <index> [--output <file>]
     pycluster.py [options]
 
 Options:
     -h, --help                       Show this screen
     -v, --verbose                    Verbose execution of jobs (optional)
     -p, --partition <str>            Overwrite the partition when using the run command.
-    -j, --jobs <str>                 Run only specific jobs (e.g. 4,8,20,24-48:4) which are compatible with the array arguments in the <config> file.
+    -j, --jobs <str>                 Run only specific jobs (e.g. 4,8,20,24-48:4) of the array in the <config> file,
+                                     only their inputfiles are created.
     -d, --dry                        If given, will not submit to cluster, but only create inputfiles.
+    -w, --workers <int>              Number of processes used to create the inputfiles [default: 1].
+    -m, --input-mode <str>           Create all inputfiles in advance (files), create them in advance in a single
+                                     pack file (pack) or let every job render its own inputfile on the compute
+                                     node (runtime).
+    -b, --bundle <int>               Bundle this number of consecutive jobs into one slurm array task.
+    -t, --throttle <int>             Maximum number of simultaneously running array tasks of each submission.
+    -c, --changed                    Run only the jobs whose inputfile changed since the last run.
+    --max-age <seconds>              Use job states cached by an earlier status query if not older [default: 30].
+    --profile                        Print the time spent in every phase of the run and write it to the bash folder.
+    --cprofile <file>                Profile the python functions with cProfile and write the statistics to <file>.
+    -r, --restart                    Merge all outputs again instead of adding the outputs of newly finished jobs.
+    -u, --update-config              Write the recommended max_memory and max_time into <config>.
+    -o, --output <file>              Write the rendered or extracted inputfile to <file> instead of stdout.
 
 Cluster configuration will be read from <config>.
 In create mode a cluster configuration will be created.
+In campaign mode the runs of all <configs> (or of the configs listed in a campaign file) are prepared in parallel and
+submitted together.
+In status mode the number of jobs of <config> in each slurm state is shown.
+In collect mode the outputs of all jobs of <config> are merged as defined by the collect section of <config>.
+In stats mode the wall time and peak memory of the jobs of <config> are summarized and resources are recommended.
+In resume mode only the jobs of <config> that did not complete successfully are submitted again.
+In render mode the inputfile of job <index> is rendered from the configuration stored with a run in its bash folder.
+In extract mode the inputfile of job <index> is read from the pack file of a run.
 """
 
 import docopt
 import os
 import pycluster
-from pycluster.createconfig import CreateConfig
-from pycluster.cluster import Cluster, InteractiveCluster
 
 
 def main(args):
+    # the modules are imported by the commands which need them, so that every command starts as fast as possible
     if args['run'] and args['<config>'] is not None:
+        from pycluster.cluster import Cluster
         config_filename = args['<config>']
         cluster_config = pycluster.parse_config(config_filename, 'config')
-        cluster = Cluster(cluster_config, partition=args['--partition'], dry=args['--dry'], jobs=args['--jobs'])
+        cluster = Cluster(cluster_config, partition=args['--partition'], dry=args['--dry'], jobs=args['--jobs'],
+                          workers=int(args['--workers']), input_mode=args['--input-mode'], changed=args['--changed'],
+                          bundle=int(args['--bundle']) if args['--bundle'] is not None else None,
+                          throttle=int(args['--throttle']) if args['--throttle'] is not None else None,
+                          profile=args['--profile'])
         cluster.run()
+        if args['--profile']:
+            cluster.report_profile()
+    elif args['campaign'] and args['<configs>']:
+        from pycluster.campaign import Campaign, parse_campaign
+        campaign = Campaign(parse_campaign(args['<configs>']), partition=args['--partition'], dry=args['--dry'],
+                            workers=int(args['--workers']), input_mode=args['--input-mode'], changed=args['--changed'],
+                            bundle=int(args['--bundle']) if args['--bundle'] is not None else None,
+                            throttle=int(args['--throttle']) if args['--throttle'] is not None else None)
+        campaign.run()
+    elif args['resume'] and args['<config>'] is not None:
+        from pycluster.cluster import Cluster
+        from pycluster.resume import find_incomplete_jobs
+        from pycluster.ranges import compress_range
+        cluster_config = pycluster.parse_config(args['<config>'], 'config')
+        partition = args['--partition'] if args['--partition'] is not None else cluster_config['cluster']['partition']
+        array = cluster_config['array']
+        incomplete = find_incomplete_jobs(cluster_config, pycluster.parse_settings(), partition,
+                                          range(array['first'], array['last'] + array['step'], array['step']))
+        if incomplete:
+            cluster = Cluster(cluster_config, partition=args['--partition'], dry=args['--dry'],
+                              jobs=compress_range(incomplete), workers=int(args['--workers']),
+                              input_mode=args['--input-mode'],
+                              bundle=int(args['--bundle']) if args['--bundle'] is not None else None,
+                              throttle=int(args['--throttle']) if args['--throttle'] is not None else None,
+                              profile=args['--profile'])
+            cluster.run()
+            if args['--profile']:
+                cluster.report_profile()
+    elif args['status'] and args['<config>'] is not None:
+        from pycluster.status import print_status
+        cluster_config = pycluster.parse_config(args['<config>'], 'config')
+        partition = args['--partition'] if args['--partition'] is not None else cluster_config['cluster']['partition']
+        array = cluster_config['array']
+        print_status(cluster_config, pycluster.parse_settings(), partition,
+                     range(array['first'], array['last'] + array['step'], array['step']), float(args['--max-age']))
+    elif args['collect'] and args['<config>'] is not None:
+        from pycluster.collect import collect_outputs
+        cluster_config = pycluster.parse_config(args['<config>'], 'config')
+        if 'collect' not in cluster_config:
+            print('Please define the outputs to merge in the collect section of the configuration.')
+            return
+        collects = cluster_config['collect']
+        if isinstance(collects, dict):
+            collects = [collects]
+        array = cluster_config['array']
+        for collect in collects:
+            collect_outputs(cluster_config, range(array['first'], array['last'] + array['step'], array['step']),
+                            collect, workers=int(args['--workers']), restart=args['--restart'])
+    elif args['stats'] and args['<config>'] is not None:
+        from pycluster.stats import print_stats
+        cluster_config = pycluster.parse_config(args['<config>'], 'config')
+        array = cluster_config['array']
+        print_stats(cluster_config, range(array['first'], array['last'] + array['step'], array['step']),
+                    config_filename=args['<config>'] if args['--update-config'] else None)
+    elif args['render'] and args['<config>'] is not None:
+        from pycluster.generate import render_inputfile
+        # Render a single input file (e.g. inside a job), the output must not be cluttered
+        cluster_config = pycluster.parse_config(args['<config>'], 'config')
+        render_inputfile(cluster_config, int(args['<index>']), args['--output'])
+        return
+    elif args['extract'] and args['<config>'] is not None:
+        from pycluster.pack import extract_inputfile
+        cluster_config = pycluster.parse_config(args['<config>'], 'config')
+        extract_inputfile(cluster_config, int(args['<index>']), args['--output'])
+        return
     elif args['create'] and args['<config-type>'] is not None:
+        from pycluster.createconfig import CreateConfig
         # Create config file
         cluster_config = pycluster.parse_config(
             os.path.join(os.path.dirname(__file__), 'configs', '{}.json'.format(args['<config-type>'])),
@@ -40,6 +139,7 @@ def main(args):
         config = CreateConfig(cluster_config, args['<config-type>'])
         config.write()
     elif args['interactive'] and args['<partition>'] is not None:
+        from pycluster.interactive import InteractiveCluster
         cluster = InteractiveCluster(partition=args['<partition>'], dry=args['--dry'])
         cluster.run()
     else:
@@ -51,4 +151,10 @@ def main(args):
 if __name__ == '__main__':
     # Parse the command line arguments:
     args = docopt.docopt(__doc__)
-    main(args)
+    if args['--cprofile'] is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(main, args)
+        profiler.dump_stats(args['--cprofile'])
+    else:
+        main(args)
@@ -1,4 +1,38 @@
-from pycluster.config import *
-from pycluster.userinput import *
-from pycluster.createconfig import CreateConfig
-from pycluster.custom_filters import *
\ No newline at end of file
+import importlib
+
+# the names are imported from their modules when they are used for the first time, so that commands which do not
+# render templates do not need to import jinja2
+_modules = {
+    'parse_config': 'pycluster.config',
+    'parse_settings': 'pycluster.config',
+    'get_partition_idx': 'pycluster.config',
+    'get_project_path': 'pycluster.config',
+    'get_shard': 'pycluster.config',
+    'get_shards': 'pycluster.config',
+    'get_input_filename': 'pycluster.config',
+    'get_log_filename': 'pycluster.config',
+    'get_output_path': 'pycluster.config',
+    'get_cache_directory': 'pycluster.config',
+    'parseynanswer': 'pycluster.userinput',
+    'variableinput': 'pycluster.userinput',
+    'typedvariableinput': 'pycluster.userinput',
+    'validatedvariableinput': 'pycluster.userinput',
+    'CreateConfig': 'pycluster.createconfig',
+    'setup_filters': 'pycluster.custom_filters',
+    'task_random': 'pycluster.custom_filters',
+    'filter_filesize': 'pycluster.custom_filters',
+    'filter_randomint': 'pycluster.custom_filters',
+    'filter_randomfloat': 'pycluster.custom_filters',
+    'filter_readtxt': 'pycluster.custom_filters',
+    'get_read_files': 'pycluster.custom_filters'
+}
+
+__all__ = list(_modules)
+
+
+def __getattr__(name):
+    if name in _modules:
+        value = getattr(importlib.import_module(_modules[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,320 @@
+import io
+import os
+import sys
+import json
+import time
+import contextlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from jinja2 import TemplateNotFound
+from pycluster.config import *
+from pycluster.generate import get_environment
+from pycluster.ranges import *
+from pycluster.cluster import Cluster
+
+__all__ = [
+    'parse_campaign',
+    'Campaign'
+]
+
+# the template environment of the campaign, inherited by the processes preparing the runs
+_campaign = {}
+
+# options of job.sh which differ between runs that can be combined into one array
+_OWN_OPTIONS = ['--job-name', '--output', '--error']
+
+
+def parse_campaign(filenames):
+    """
+    Read the configurations of a campaign, either given as a campaign file or as a list of cluster configurations. A
+    campaign file has a name, an output_directory (optional) and a list of configs, whose file names are relative to
+    the campaign file.
+    :param filenames: The file name of the campaign file or the file names of the cluster configurations
+    :return: Dict with the name, the output directory (None to use the one of the first configuration) and the file
+    names of the configurations of the campaign
+    """
+    if len(filenames) == 1:
+        data = parse_config(filenames[0], 'config')
+        if 'configs' in data:
+            directory = os.path.dirname(os.path.abspath(filenames[0]))
+            return {
+                'name': data.get('name', os.path.splitext(os.path.basename(filenames[0]))[0]),
+                'output_directory': data.get('output_directory'),
+                'configs': [os.path.join(directory, fname) for fname in data['configs']]
+            }
+    return {'name': 'campaign', 'output_directory': None, 'configs': list(filenames)}
+
+
+def _prepare(config, options, settings):
+    """
+    Prepare a run in a process of its own. Its output is returned, so that the outputs of runs prepared at the same
+    time are not mixed.
+    :return: The prepared Cluster (None if the configuration is invalid) and the output
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            cluster = Cluster(config, settings=settings, env=_campaign.get('env'), **options)
+        except SystemExit:
+            cluster = None
+        except Exception as e:
+            _report_error(e)
+            cluster = None
+    return cluster, output.getvalue()
+
+
+def _report_error(error):
+    """
+    Report an error of preparing a run (e.g. a template that does not exist), the other runs are prepared anyway.
+    """
+    print('The run could not be prepared: {}: {}'.format(type(error).__name__, error))
+
+
+def _get_sbatch_options(cluster):
+    """
+    Get the slurm options of the job file of a run, except for those which are set per run.
+    """
+    with open(cluster.get_sh_filename()) as in_file:
+        return [line.strip() for line in in_file if line.startswith('#SBATCH') and
+                not any(line.split()[1].startswith(option) for option in _OWN_OPTIONS)]
+
+
+class Campaign:
+    def __init__(self, campaign, partition=None, dry=False, workers=1, input_mode=None, changed=False, bundle=None,
+                 throttle=None):
+        """
+        Prepares the runs of many cluster configurations in one invocation. The runs share the settings and the
+        template environment, and are prepared in parallel.
+        :param campaign: The campaign as returned by parse_campaign()
+        :param partition: Overwrite for the partition of all runs (if None, then no overwrite)
+        :param dry: Dry run: prepare the runs, but don't submit them to the cluster.
+        :param workers: Number of processes to prepare the runs with. The runs are prepared at the same time, the
+        input files of a single run are generated with the remaining processes.
+        :param input_mode: Overwrite how input files are provided to the jobs of all runs (if None, then no overwrite)
+        :param changed: Run only the jobs whose input file changed since the last run
+        :param bundle: Overwrite the number of consecutive jobs bundled into one slurm array task (if None, then no
+        overwrite)
+        :param throttle: Overwrite the maximum number of simultaneously running array tasks (if None, then no
+        overwrite)
+        """
+        self.name = campaign['name']
+        self.dry = dry
+        self.filenames = campaign['configs']
+        if not self.filenames:
+            print('The campaign {} has no configurations.'.format(self.name))
+            sys.exit(1)
+        configs = [parse_config(fname, 'config') for fname in self.filenames]
+        self.directory = os.path.join(campaign['output_directory'] or configs[0]['output_directory'],
+                                      self.name + '.campaign')
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.settings = parse_settings()
+        self.env = get_environment()
+        # the templates are compiled once, before the processes preparing the runs are started
+        for name in ['job.sh', 'local.sh', 'campaign.sh'] + sorted(set(config['inputfile'] for config in configs)):
+            try:
+                self.env.get_template(name)
+            except TemplateNotFound:
+                pass
+
+        options = {'partition': partition, 'dry': dry, 'input_mode': input_mode, 'changed': changed,
+                   'bundle': bundle, 'throttle': throttle}
+        self.clusters = self.prepare(configs, options, max(1, workers))
+        self.results = [{
+            'config': fname,
+            'project_name': config['project_name'],
+            'status': 'prepared' if cluster is not None else 'invalid',
+            'submission': None,
+            'jobids': []
+        } for fname, config, cluster in zip(self.filenames, configs, self.clusters)]
+
+    def prepare(self, configs, options, workers):
+        """
+        Prepare all runs: create their directories, job files and input files.
+        :param configs: The cluster configurations
+        :param options: The options of the Cluster of every run
+        :param workers: Number of processes
+        :return: The list of the prepared Clusters (None for invalid configurations)
+        """
+        clusters = [None] * len(configs)
+        processes = min(workers, len(configs))
+        if processes <= 1:
+            for i, config in enumerate(configs):
+                print('Preparing {} ({:d}/{:d}):'.format(self.filenames[i], i + 1, len(configs)))
+                try:
+                    clusters[i] = Cluster(config, workers=workers, settings=self.settings, env=self.env, **options)
+                except SystemExit:
+                    pass
+                except Exception as e:
+                    _report_error(e)
+            return clusters
+
+        options = dict(options, workers=max(1, workers // processes))
+        _campaign['env'] = self.env
+        print('Preparing {:d} runs, {:d} at the same time.'.format(len(configs), processes))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(_prepare, config, options, self.settings): i for i, config in enumerate(configs)}
+            for done, future in enumerate(as_completed(futures)):
+                i = futures[future]
+                clusters[i], output = future.result()
+                print('Prepared {} ({:d}/{:d}):'.format(self.filenames[i], done + 1, len(configs)))
+                sys.stdout.write(output)
+        _campaign.clear()
+        return clusters
+
+    def get_combined_arrays(self, indices):
+        """
+        Combine the runs on slurm which have the same resources into as few job arrays as possible. Every run gets its
+        own range of array task ids of the combined array, which are shifted to the array task ids of the run by an
+        offset. Runs with stages, with a throttle or with more than one submission are submitted on their own.
+        :param indices: The indices of the runs to submit
+        :return: The combined arrays, each a list of tuples of the index of a run and its submission, and the list of
+        the indices of the runs submitted on their own
+        """
+        groups = {}
+        own = []
+        for i in indices:
+            cluster = self.clusters[i]
+            submissions = cluster.get_submissions()
+            if cluster.stages or cluster.config['cluster'].get('throttle') is not None or len(submissions) != 1:
+                own.append(i)
+                continue
+            key = (cluster.config['cluster']['partition'], tuple(_get_sbatch_options(cluster)))
+            groups.setdefault(key, []).append((i, submissions[0]))
+
+        arrays = []
+        for runs in groups.values():
+            if len(runs) == 1:
+                own.append(runs[0][0])
+                continue
+            max_array_size = self.clusters[runs[0][0]].max_array_size
+            array = []
+            first = 0
+            for i, submission in runs:
+                tasks = expand_range(submission['array'])
+                if array and first + tasks[-1] - tasks[0] >= max_array_size:
+                    arrays.append(array)
+                    array = []
+                    first = 0
+                shift = first - tasks[0]
+                array.append((i, {'array': compress_range(task + shift for task in tasks),
+                                  'offset': submission['offset'] - shift * submission['step'],
+                                  'step': submission['step']}))
+                first = tasks[-1] + shift + 1
+            arrays.append(array)
+        # a combined array of a single run is submitted as usual
+        own += [array[0][0] for array in arrays if len(array) == 1]
+        return [array for array in arrays if len(array) > 1], sorted(own)
+
+    def write_combined_array(self, number, array):
+        """
+        Write the job file of a combined array, which runs the job file of the run an array task belongs to.
+        :param number: The number of the combined array
+        :param array: The runs of the combined array as returned by get_combined_arrays()
+        :return: The file name of the job file
+        """
+        runs = []
+        for i, submission in array:
+            cluster = self.clusters[i]
+            tasks = expand_range(submission['array'])
+            # job.sh writes its log files itself, as the offset is set
+            variables = dict(cluster.get_submit_variables(submission),
+                             PYCLUSTER_INDEX_OFFSET='{:d}'.format(submission['offset']))
+            runs.append({'first': tasks[0], 'last': tasks[-1], 'variables': variables,
+                         'jobfile': cluster.get_sh_filename()})
+        fname = os.path.join(self.directory, '{}_{:d}.sh'.format(self.name, number))
+        with open(fname, 'w') as out_file:
+            out_file.write(self.env.get_template('campaign.sh').render(
+                name=self.name, sbatch=_get_sbatch_options(self.clusters[array[0][0]]), runs=runs))
+        os.chmod(fname, 0o755)
+        return fname
+
+    def get_combined_submit_command(self, array, fname):
+        """
+        Get the bash command to submit a combined array.
+        :param array: The runs of the combined array as returned by get_combined_arrays()
+        :param fname: The job file of the combined array
+        :return: The command
+        """
+        cluster = self.clusters[array[0][0]]
+        tasks = []
+        for i, submission in array:
+            tasks += expand_range(submission['array'])
+        return '{}export SLURM_CONF={};{} --parsable --array={} -N1 {}'.format(
+            cluster.job_init_command,
+            cluster.slurmconf,
+            self.settings.get('commands', {}).get('sbatch', 'sbatch'),
+            compress_range(tasks),
+            fname
+        )
+
+    def run(self):
+        """
+        Runs the jobs of all runs on the local machine (one run after the other) or submits them to the cluster, with
+        runs of the same resources combined into one job array.
+        """
+        indices = [i for i, cluster in enumerate(self.clusters) if cluster is not None]
+        for i in indices:
+            if self.clusters[i].config.get('jobs') == '':
+                self.results[i]['status'] = 'unchanged'
+        indices = [i for i in indices if self.results[i]['status'] != 'unchanged']
+        local = [i for i in indices if self.clusters[i].config['cluster']['partition'] == 'local']
+        remote = [i for i in indices if i not in local]
+
+        for i in local:
+            print('Running {}:'.format(self.filenames[i]))
+            self.clusters[i].run()
+            self.results[i].update(submission='local', status='dry' if self.dry else 'ran')
+
+        if not self.dry:
+            remote = [i for i in remote if self.clusters[i].validate_config()]
+            for i in indices:
+                if i not in local and i not in remote:
+                    self.results[i]['status'] = 'not submitted'
+        arrays, own = self.get_combined_arrays(remote)
+        for number, array in enumerate(arrays):
+            command = self.get_combined_submit_command(array, self.write_combined_array(number, array))
+            if self.dry:
+                print('Cluster command of the combined array #{:d} is: <{}>.'.format(number, command))
+                jobid = '<jobid of combined array #{:d}>'.format(number)
+            else:
+                result = subprocess.run(command, shell=True, executable='/bin/bash', stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+                jobid = result.stdout.strip().split(';')[0] if result.returncode == 0 else None
+                if jobid is None:
+                    print('Submission of the combined array #{:d} failed.'.format(number))
+                else:
+                    print('Submitted batch job {} (combined array of {:d} runs).'.format(jobid, len(array)))
+            for i, submission in array:
+                if jobid is not None and not self.dry:
+                    self.clusters[i].record_job(jobid, submission)
+                self.results[i].update(submission='combined #{:d} ({})'.format(number, submission['array']),
+                                       status='dry' if self.dry else 'submitted' if jobid is not None else 'failed',
+                                       jobids=[jobid] if jobid is not None else [])
+
+        for i in own:
+            cluster = self.clusters[i]
+            if self.dry:
+                print('Cluster command of {} is: <{}>.'.format(self.filenames[i],
+                                                               '\n'.join(cluster.get_submit_commands())))
+                self.results[i].update(submission='own', status='dry')
+            else:
+                jobids = cluster.submit()
+                self.results[i].update(submission='own', status='submitted' if jobids else 'failed', jobids=jobids)
+        self.write_summary()
+
+    def write_summary(self):
+        """
+        Prints which job ids every run of the campaign got and writes this summary to <name>.summary.json in the
+        directory of the campaign.
+        """
+        print('Summary of the campaign {} ({:d} runs):'.format(self.name, len(self.results)))
+        for result in self.results:
+            submission = ' ({})'.format(result['submission']) if result['submission'] else ''
+            print('   {:<40} {:<24} {:<13} {}'.format(result['config'], result['project_name'], result['status'],
+                                                     (', '.join(result['jobids']) + submission).strip()))
+        fname = os.path.join(self.directory, self.name + '.summary.json')
+        with open(fname, 'w') as out_file:
+            json.dump({'name': self.name, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': self.results}, out_file,
+                      indent=4)
+        print('The summary was written to {}.'.format(fname))
@@ -1,31 +1,67 @@
 import os
-import stat
-from jinja2 import Environment, FileSystemLoader
-import copy
+import json
+import random
+import time
 import shutil
 import subprocess
 import getpass
+import tempfile
 from pycluster.userinput import *
 from pycluster.custom_filters import *
 from pycluster.config import *
+from pycluster.generate import *
+from pycluster.pack import *
+from pycluster.context import *
+from pycluster.manifest import *
+from pycluster.ranges import *
+from pycluster.executor import *
+from pycluster.slurm import *
+from pycluster.sweep import *
+from pycluster.profiling import *
+from pycluster.writer import *
+from pycluster.pipeline import *
+from pycluster.worker import get_worker_filename
+from pycluster.interactive import InteractiveCluster
 import sys
 
 
+def _is_shifted(submission):
+    """
+    Check if the array task ids of a submission differ from the job indices (or bundles) they run.
+    """
+    return submission['offset'] != 0 or submission.get('step', 1) != 1
+
+
 class Cluster:
-    def __init__(self, config, partition=None, dry=False, jobs=None):
+    def __init__(self, config, partition=None, dry=False, jobs=None, workers=1, input_mode=None, changed=False,
+                 bundle=None, throttle=None, profile=False, settings=None, env=None):
         """
         The constructor of the cluster class takes care of all preparation necessary before submitting jobs to the
         cluster, such as creating directories and generating input files.
         :param config: Cluster configuration file
         :param partition: Overwrite for the cluster patition (if None, then no overwrite)
         :param dry: Dry run: perform only peparatory steps, don't submit to cluster.
+        :param jobs: Overwrite for the jobs to run (if None, then no overwrite)
+        :param workers: Number of processes to generate the input files with
+        :param input_mode: Overwrite how input files are provided to the jobs (if None, then no overwrite): 'files'
+        creates all input files in advance, 'pack' creates them in advance in a single pack file and 'runtime' renders
+        the input file of each job on the compute node.
+        :param changed: Run only the jobs whose input file changed since the last run (if no jobs are given)
+        :param bundle: Overwrite the number of consecutive jobs bundled into one slurm array task (if None, then no
+        overwrite)
+        :param throttle: Overwrite the maximum number of simultaneously running array tasks (if None, then no
+        overwrite)
+        :param profile: Measure the time of every input file in addition to the time of every phase of the run
+        :param settings: The settings, if already parsed (e.g. shared by the runs of a campaign)
+        :param env: The template environment, if already created (e.g. shared by the runs of a campaign)
         """
+        self.profiler = Profiler(enabled=profile)
         self.config = config
         self.dry = dry
         self.jobs = jobs
 
         # load settings
-        self.settings = parse_settings()
+        self.settings = settings if settings is not None else parse_settings()
 
         # make username available
         self.config['user'] = getpass.getuser()
@@ -35,15 +71,70 @@ class Cluster:
             self.config['cluster']['partition'] = partition
         if jobs is not None:
             self.config['jobs'] = jobs
+        if bundle is not None:
+            self.config['cluster']['bundle'] = bundle
+        if throttle is not None:
+            self.config['cluster']['throttle'] = throttle
+        self.config['cluster'].setdefault('bundle', 1)
+        self.config['cluster'].setdefault('cpus_per_task', 1)
+        if input_mode is not None:
+            self.config['input_mode'] = input_mode
+        elif 'input_mode' not in self.config:
+            self.config['input_mode'] = 'files'
+        if self.config['input_mode'] not in ['files', 'pack', 'runtime']:
+            print('The input mode {} is not known. Please use "files", "pack" or "runtime".'.format(
+                self.config['input_mode']))
+            sys.exit(1)
+        # jobs running in node-local scratch copy their output subdirectories back (as a tar archive if requested)
+        if self.config.get('scratch'):
+            scratch = self.config['scratch'] if isinstance(self.config['scratch'], dict) else {}
+            self.config['scratch'] = dict({'directory': '${TMPDIR:-/tmp}', 'archive': False}, **scratch)
+            if not self.config.get('output_subdirectories'):
+                print('Warning: jobs running in scratch only copy the output_subdirectories back, but the '
+                      'configuration has none.')
+        # python input files run in persistent workers of the python executable, which import their modules once
+        if self.config.get('worker'):
+            if not isinstance(self.config['worker'], dict):
+                self.config['worker'] = {}
+            if self.config.get('scratch'):
+                print('The python workers run the input files in the shared output directory, they cannot be combined '
+                      'with scratch.')
+                sys.exit(1)
+        shard_size = self.config.get('shard_size', 0)
+        if not isinstance(shard_size, int) or isinstance(shard_size, bool) or shard_size < 0:
+            print('The shard_size {} is not a number of jobs per subdirectory.'.format(shard_size))
+            sys.exit(1)
+        # only the selected jobs of the array are rendered and run
+        if self.config.get('jobs') is not None:
+            try:
+                selected = RangeSet.parse(self.config['jobs'])
+            except ValueError as e:
+                print(e)
+                sys.exit(1)
+            jobs = selected & RangeSet(self.get_array_range())
+            if not jobs:
+                print('None of the selected jobs <{}> is part of the array.'.format(self.config['jobs']))
+                sys.exit(1)
+            if len(jobs) < len(selected):
+                print('Warning: {:d} of the selected jobs are not part of the array and are ignored: <{}>.'.format(
+                    len(selected) - len(jobs), selected - jobs))
+            self.config['jobs'] = str(jobs)
+
+        # every task draws its random numbers from its own stream derived from this master seed
+        if 'random_seed' not in self.config:
+            if os.path.isfile(self.get_config_filename()):
+                # keep the seed of the previous run, so that input files of resubmitted jobs do not change
+                self.config['random_seed'] = parse_config(self.get_config_filename(), 'config')['random_seed']
+            else:
+                self.config['random_seed'] = random.SystemRandom().randint(0, 2**31 - 1)
+            print('No random_seed given in the configuration, using random_seed={:d}.'.format(
+                self.config['random_seed']))
 
-        self.env = Environment(
-            loader=FileSystemLoader(os.path.abspath(os.path.join(os.path.dirname(__file__), '../templates'))),
-            cache_size=0
-        )
-        self.env = setup_filters(self.env)
+        self.env = env if env is not None else get_environment()
         self.template = self.env.get_template(self.config['inputfile'])
         self.jobtemplate = self.env.get_template('job.sh')
         self.localtemplate = self.env.get_template('local.sh')
+        self.context = None
         self._local_cpu_count = None
 
         # determine slurm configuration in advance
@@ -54,110 +145,472 @@ class Cluster:
         else:
             self.job_init_command = ''
         self.priority_queue = self.settings['partitions'][self.partition_idx]['priority_queue']
+        self.max_array_size = self.settings['partitions'][self.partition_idx].get('max_array_size', 1001)
+        self.profiler.mark('setup')
 
         # create subdirectories
-        createdirs = ['bash', 'err', 'log', 'inputfiles']
+        createdirs = ['bash', 'err', 'log']
+        if self.config['input_mode'] != 'runtime':
+            createdirs.append('inputfiles')
         if 'output_subdirectories' in self.config:
             createdirs += self.config['output_subdirectories']
+        if self.config.get('scratch') and self.config['scratch']['archive']:
+            createdirs.append('archive')
         for createdir in createdirs:
             directory = os.path.join(self.config['output_directory'], self.config['project_name'], createdir)
             os.makedirs(directory, exist_ok=True)
-
-        # copy executable if requested
+        # create the subdirectories of the input, log and err files of all jobs (and of the log files of all bundles)
+        shards = set(get_shards(self.config, self.get_array_range()))
+        if self.config['cluster']['bundle'] > 1:
+            shards.update(get_shards(self.config, range(self.get_bundle(self.get_array_range()[-1]) + 1)))
+        sharddirs = [createdir for createdir in ['err', 'log', 'inputfiles', 'archive'] if createdir in createdirs]
+        for shard in sorted(shards):
+            for createdir in sharddirs:
+                os.makedirs(get_project_path(self.config, createdir, shard), exist_ok=True)
+        self.profiler.mark('directories')
+
+        # copy executable if requested (and not copied before)
         if 'copy_executable' in self.config and self.config['copy_executable']:
             fname = os.path.split(self.config['executable'])[1]
             dst = os.path.join(self.config['output_directory'], self.config['project_name'], 'bash', fname)
-            shutil.copy(self.config['executable'], dst)
+            src_stat = os.stat(self.config['executable'])
+            if not os.path.isfile(dst) or os.stat(dst).st_size != src_stat.st_size or \
+                    os.stat(dst).st_mtime != src_stat.st_mtime:
+                shutil.copy2(self.config['executable'], dst)
             self.config['executable'] = dst
-
+        self.profiler.mark('executable')
+
+        # the configuration is complete now, share it read-only between all templates
+        self.context = RenderContext(self.config, self._cpu_count())
+
+        # map the array onto the points of the parameter sweep and store the parameters of every job
+        if self.context.sweep is not None:
+            array_range = self.get_array_range()
+            print('The array of {:d} jobs runs {:.4g} times through the {:d} points of the sweep over {}.'.format(
+                len(array_range), len(array_range) / len(self.context.sweep), len(self.context.sweep),
+                ', '.join(self.context.sweep.names)))
+            write_parameter_table(self.context, array_range, get_parameter_table_filename(self.config))
+
+        # the configuration, job files and input files are written in the background and only published when they
+        # are complete, as jobs of an earlier submission may read them at the same time (e.g. at runtime)
+        try:
+            with FileWriter(self.get_staging_directory()) as self.writer:
+                # store the configuration used for this run (including the random seed) to reproduce the input files
+                self.writer.write(self.get_config_filename(),
+                                  json.dumps(self.context.base, indent=4, sort_keys=False))
+                self.profiler.mark('configuration')
+                self.write_files(workers, changed)
+        except OSError as e:
+            print('Writing the files of the run failed: {}'.format(e))
+            sys.exit(1)
+        self.profiler.mark('input files')
+
+        # the later stages of a pipeline are runs of their own, submitted together with this run
+        self.stages = []
+        for stage_config in get_stage_configs(self.config):
+            print('Preparing the stage {} ({}):'.format(stage_config['stage']['name'],
+                                                        stage_config['stage']['dependency']))
+            self.stages.append(Cluster(stage_config, dry=dry, workers=workers, settings=self.settings, env=self.env))
+        if self.stages:
+            self.profiler.mark('stages')
+        self.profiler.info.update(project_name=self.config['project_name'], input_mode=self.config['input_mode'],
+                                  partition=self.config['cluster']['partition'], workers=workers,
+                                  tasks=len(self.get_array_range()))
+
+    def write_files(self, workers=1, changed=False):
+        """
+        Writes the job files and the input files of the run.
+        :param workers: Number of processes to generate the input files with
+        :param changed: Run only the jobs whose input file changed (if no jobs are given)
+        """
         # generate job file and make it executable
         configuration = self.get_config_copy()
-        output = self.jobtemplate.render(configuration)
-        fname = self.get_sh_filename()
-        with open(fname, 'w') as out_file:
-            out_file.write(output)
-        os.chmod(fname, os.stat(fname).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        configuration['pycluster'] = '"{}" "{}"'.format(
+            sys.executable, os.path.abspath(os.path.join(os.path.dirname(__file__), '../pycluster.py'))
+        )
+        configuration['config_filename'] = self.get_config_filename()
+        configuration['pycluster_worker'] = get_worker_filename()
+        self.write_executable(self.get_sh_filename(), self.jobtemplate.render(configuration))
 
         # generate local execution file and make it executable
         configuration = self.get_config_copy()
-        output = self.localtemplate.render(configuration)
-        fname = self.get_sh_filename(filetype='local')
-        with open(fname, 'w') as out_file:
-            out_file.write(output)
-        os.chmod(fname, os.stat(fname).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        self.write_executable(self.get_sh_filename(filetype='local'), self.localtemplate.render(configuration))
+        self.profiler.mark('job files')
+
+        # store the compiled template, so that input files can be rendered later (e.g. by the jobs at runtime)
+        compile_template(self.env, self.config['inputfile'], get_project_path(self.config, 'bash', 'templates'),
+                         writer=self.writer)
+        self.profiler.mark('compile template')
 
         # generate input files
-        array_range = range(
-            self.config['array']['first'],
-            self.config['array']['last'] + self.config['array']['step'],
-            self.config['array']['step']
-        )
-        print('Writing {:d} input files...'.format(len(array_range)))
-        for iterator in array_range:
-            self.reload_template()  # to avoid caching of the random filter
-            configuration = self.get_config_copy(iterator)
-            output = self.template.render(configuration)
-            fname = self.get_output_filename(iterator)
-            with open(fname, 'w') as out_file:
-                out_file.write(output)
+        if self.config['input_mode'] == 'runtime':
+            print('Input files will be rendered by each job at runtime.')
+        else:
+            array_range = self.get_job_range()
+            if self.config['input_mode'] == 'pack':
+                print('Writing {:d} input files to {}...'.format(len(array_range), get_pack_filename(self.config)))
+                # the pack is staged like all other files and published only when it is complete, if only some jobs
+                # are rendered, the input files of the other jobs are taken over from the previous pack
+                with PackWriter(get_pack_filename(self.config), staging=self.writer.staging,
+                                merge=self.config.get('jobs') is not None) as pack:
+                    generate_inputfiles(self.template, self.config, self._cpu_count(), array_range, workers=workers,
+                                        pack=pack, profiler=self.profiler)
+            else:
+                self.write_inputfiles(array_range, workers, changed)
+
+    def write_inputfiles(self, array_range, workers=1, changed=False):
+        """
+        Writes the input files. Input files are only written if they changed since the last run, which is tracked by
+        the manifest of the run. If the template and the configuration did not change, input files are not even
+        rendered again.
+        :param array_range: The iterators of all jobs to run
+        :param workers: Number of processes to generate the input files with
+        :param changed: Run only the jobs whose input file changed (if no jobs are given)
+        """
+        manifest = Manifest(get_project_path(self.config, 'bash', self.config['project_name'] + '.manifest.json'))
+        sources = {
+            'template': get_template_digest(self.env, self.config['inputfile']),
+            'config': get_digest(json.dumps(
+                {key: value for key, value in self.context.base.items() if key != 'jobs'}, sort_keys=True
+            ))
+        }
+        if manifest.is_current(sources):
+            existing = set()
+            for shard in get_shards(self.config, array_range) or ['']:
+                existing.update(os.path.join(shard, fname)
+                                for fname in os.listdir(get_project_path(self.config, 'inputfiles', shard)))
+            iterators = [
+                iterator for iterator in array_range if iterator not in manifest.tasks or
+                os.path.join(get_shard(self.config, iterator), os.path.basename(self.get_output_filename(iterator)))
+                not in existing
+            ]
+            print('Template and configuration are unchanged, {:d} of {:d} input files are up to date.'.format(
+                len(array_range) - len(iterators), len(array_range)))
+        else:
+            iterators = array_range
+
+        if len(iterators) > 0:
+            print('Writing {:d} input files...'.format(len(iterators)))
+        files = {}
+        digests, changed_iterators = generate_inputfiles(self.template, self.config, self._cpu_count(), iterators,
+                                                         workers=workers, digests=manifest.tasks,
+                                                         profiler=self.profiler, writer=self.writer, files=files)
+        manifest.update(sources, digests, files)
+        manifest.save()
+
+        if len(changed_iterators) < len(array_range):
+            if len(changed_iterators) == 0:
+                print('No input file changed.')
+            else:
+                print('{:d} of {:d} input files changed: <{}>.'.format(
+                    len(changed_iterators), len(array_range), compress_range(changed_iterators)))
+            if changed and self.config.get('jobs') is None:
+                self.config['jobs'] = compress_range(changed_iterators)
+
+    def write_executable(self, fname, content):
+        """
+        Writes a bash file and makes it executable. The file is not written again if its content did not change.
+        :param fname: The file name
+        :param content: The content of the file
+        """
+        if os.path.isfile(fname):
+            with open(fname) as in_file:
+                if in_file.read() == content:
+                    return
+        self.writer.write(fname, content, executable=True)
 
     def run(self):
         """
         Submits a job array to the cluster.
         """
+        if self.config.get('jobs') == '':
+            print('No jobs changed since the last run, nothing to submit.')
+            return
+
         local_execution = self.config['cluster']['partition'] == 'local'
 
         if local_execution:
+            # the local bash file is equivalent, but the jobs are executed by a work queue
             command = self.get_sh_filename(filetype='local')
-            if 'jobs' in self.config and self.config['jobs'] is not None:
-                question = 'Warning:\n' \
-                           'You are running a job array locally with the <jobs> option to specify execution only ' \
-                           'of a few jobs. This is only supported on the slurm cluster and instead all jobs will ' \
-                           'run. >>> Do you want to continue?'
-                if not parseynanswer(question):
-                    command = None
+            if self.config.get('jobs') is not None:
+                # the local bash file runs only the selected jobs, like the work queue
+                command = 'PYCLUSTER_JOBS={} {}'.format(self.config['jobs'], command)
+            executor = self.get_local_executor()
         else:
-            if 'jobs' in self.config and self.config['jobs'] is not None:
-                jobstring = self.config['jobs']
-            else:
-                jobstring = '{:d}-{:d}:{:d}'.format(
-                    self.config['array']['first'],
-                    self.config['array']['last'],
-                    self.config['array']['step'],
-                )
-            command = '{}export SLURM_CONF={};' \
-                      'sbatch --array={} -N1 {}'.format(
-                self.job_init_command,
-                self.slurmconf,
-                jobstring,
-                self.get_sh_filename()
-            )
+            command = '\n'.join(self.get_submit_commands())
 
         if self.dry:
             print('Running in dry mode. Will not submit to cluster. Input files were created.')
             print('Cluster command is: <{}>.'.format(command))
-        elif self.validate_config() and command is not None:
-            subprocess.run(command, shell=True, executable='/bin/bash')
+            for stage in self.stages:
+                print('The stage {} runs {:d} jobs with {}, which are defined in {}.'.format(
+                    stage.config['stage']['name'], len(stage.get_array_range()),
+                    stage.config['stage']['dependency'], stage.get_sh_filename()))
+        elif self.validate_config():
+            self.profiler.mark('validation')
+            if local_execution:
+                executors = [executor]
+                for stage in self.stages:
+                    executors.append(stage.get_local_executor(executors[-1]))
+                executor.run(stages=executors[1:])
+                self.profiler.mark('local execution')
+            else:
+                self.submit()
+                self.profiler.mark('submission')
         else:
             print('Cluster job was not submitted due to user interruption.')
 
-    def get_config_copy(self, iterator=None):
+    def report_profile(self):
         """
-        Get a deep copy of the configuration replacing some dependent variables.
-        :param iterator: Make iterator available in configuration as variable.
-        :return: The copy of the confriguration
+        Prints the time spent in every phase of the run and writes the profile to bash/<project_name>.profile.json.
         """
-        # keep original structure, work on deep copy
-        dictionary = copy.deepcopy(self.config)
-        dictionary['iterator'] = iterator
-        dictionary['cores_local'] = self._cpu_count()
-        return dictionary
+        self.profiler.report(get_project_path(self.config, 'bash', self.config['project_name'] + '.profile.json'))
 
-    def reload_template(self):
+    def get_submissions(self):
         """
-        Resets the template file from disk
+        Get the slurm array tasks to submit. The array task ids are the job indices (or the bundles) as long as they
+        are below the maximum array size of the partition. Larger arrays are submitted by array position instead: the
+        positions are split into submissions of at most max_array_size array tasks each, and job.sh computes the job
+        index of an array task as offset + task id * step.
+        :return: List of submissions, each a dict with the range expression of the array, the offset and the step
         """
-        self.template = self.env.get_template(self.config['inputfile'])
+        iterators = self.get_job_range()
+        if self.config['cluster']['bundle'] > 1:
+            # bundles are numbered by their position in the array already
+            tasks = sorted(set(self.get_bundle(iterator) for iterator in iterators))
+            first, step = 0, 1
+        else:
+            tasks = list(iterators)
+            first, step = self.config['array']['first'], self.config['array']['step']
+        if not tasks:
+            return []
+        if tasks[-1] < self.max_array_size:
+            return [{'array': compress_range(tasks), 'offset': 0, 'step': 1}]
+
+        positions = [(task - first) // step for task in tasks]
+        submissions = []
+        start = positions[0]
+        chunk = []
+        for position in positions:
+            if position - start >= self.max_array_size:
+                submissions.append({'array': compress_range(p - start for p in chunk), 'offset': first + start * step,
+                                    'step': step})
+                start = position
+                chunk = []
+            chunk.append(position)
+        submissions.append({'array': compress_range(p - start for p in chunk), 'offset': first + start * step,
+                            'step': step})
+        return submissions
+
+    def get_stage_submissions(self, upstream_submissions, upstream_jobids):
+        """
+        Get the slurm array tasks to submit of a later stage of a pipeline, which depend on the job arrays of the
+        preceding stage. The array tasks of an aftercorr stage correspond to the array tasks of the preceding stage, so
+        they are split into the same submissions.
+        :param upstream_submissions: The submissions of the preceding stage
+        :param upstream_jobids: The job ids of the submissions of the preceding stage
+        :return: List of submissions, each a dict with the range expression of the array, the offset and the
+        dependency
+        """
+        if self.config['stage']['dependency'] == 'aftercorr':
+            return [dict(submission, dependency='aftercorr:{}'.format(jobid))
+                    for submission, jobid in zip(upstream_submissions, upstream_jobids)]
+        return [dict(submission, dependency='afterok:' + ':'.join(upstream_jobids))
+                for submission in self.get_submissions()]
+
+    def get_submit_commands(self):
+        """
+        Get the bash commands to submit the job arrays of the run and of all its stages. The job ids of the preceding
+        stages are not known yet, they are shown as placeholders.
+        :return: The list of commands
+        """
+        submissions = self.get_submissions()
+        commands = [self.get_submit_command(submission) for submission in submissions]
+        upstream = self
+        for stage in self.stages:
+            jobids = ['<jobid of {} #{:d}>'.format(upstream.config['project_name'], i + 1)
+                      for i in range(len(submissions))]
+            submissions = stage.get_stage_submissions(submissions, jobids)
+            commands += [stage.get_submit_command(submission) for submission in submissions]
+            upstream = stage
+        return commands
+
+    def get_submit_variables(self, submission):
+        """
+        Get the environment variables job.sh needs to run the array tasks of a submission.
+        :param submission: The submission as returned by get_submissions()
+        :return: Dict of the variables
+        """
+        variables = {}
+        if self.config['cluster']['bundle'] > 1 and 'jobs' in self.config and self.config['jobs'] is not None:
+            # the bundles run only the selected jobs
+            variables['PYCLUSTER_JOBS'] = self.config['jobs']
+        if _is_shifted(submission):
+            # slurm would name the log files by the array task ids, job.sh writes them by job index instead
+            variables['PYCLUSTER_INDEX_OFFSET'] = '{:d}'.format(submission['offset'])
+        if submission.get('step', 1) != 1:
+            variables['PYCLUSTER_INDEX_STEP'] = '{:d}'.format(submission['step'])
+        return variables
+
+    def get_submit_command(self, submission):
+        """
+        Get the bash command to submit a job array.
+        :param submission: The submission as returned by get_submissions()
+        :return: The command
+        """
+        variables = ''.join('{}={} '.format(name, value)
+                            for name, value in self.get_submit_variables(submission).items())
+        options = ''
+        if _is_shifted(submission):
+            options += ' --output=/dev/null --error=/dev/null'
+        if submission.get('dependency'):
+            # jobs whose dependency can never be satisfied are removed instead of pending forever
+            options += ' --dependency={} --kill-on-invalid-dep=yes'.format(submission['dependency'])
+        throttle = ''
+        if self.config['cluster'].get('throttle') is not None:
+            throttle = '%{:d}'.format(self.config['cluster']['throttle'])
+        return '{}export SLURM_CONF={};' \
+               '{}{} --parsable --array={}{} -N1{} {}'.format(
+            self.job_init_command,
+            self.slurmconf,
+            variables,
+            self.settings.get('commands', {}).get('sbatch', 'sbatch'),
+            submission['array'],
+            throttle,
+            options,
+            self.get_sh_filename()
+        )
+
+    def submit(self):
+        """
+        Submits all job arrays of the run and of all its stages to the cluster. The job arrays of a stage depend on the
+        job arrays of the preceding stage.
+        :return: The list of job ids of the run and of its stages
+        """
+        submissions = self.get_submissions()
+        upstream_jobids = self.submit_arrays(submissions)
+        jobids = list(upstream_jobids or [])
+        for stage in self.stages:
+            if upstream_jobids is None:
+                print('The stage {} and the following stages were not submitted.'.format(
+                    stage.config['stage']['name']))
+                break
+            submissions = stage.get_stage_submissions(submissions, upstream_jobids)
+            upstream_jobids = stage.submit_arrays(submissions)
+            jobids += upstream_jobids or []
+        return jobids
+
+    def submit_arrays(self, submissions):
+        """
+        Submits job arrays to the cluster and records their job ids in bash/<project_name>.jobs.json.
+        :param submissions: The submissions as returned by get_submissions()
+        :return: The list of job ids or None if a submission failed
+        """
+        jobids = []
+        for submission in submissions:
+            result = subprocess.run(self.get_submit_command(submission), shell=True, executable='/bin/bash',
+                                    stdout=subprocess.PIPE, universal_newlines=True)
+            if result.returncode != 0:
+                print('Submission of the array {} failed, the following arrays were not submitted.'.format(
+                    submission['array']))
+                return None
+            jobid = result.stdout.strip().split(';')[0]
+            print('Submitted batch job {} (array {}, offset {:d}{}{}).'.format(
+                jobid, submission['array'], submission['offset'],
+                ', step {:d}'.format(submission['step']) if submission.get('step', 1) != 1 else '',
+                ', {}'.format(submission['dependency']) if submission.get('dependency') else ''))
+            jobids.append(jobid)
+            self.record_job(jobid, submission)
+        return jobids
+
+    def record_job(self, jobid, submission):
+        """
+        Appends a submitted job array to bash/<project_name>.jobs.json.
+        :param jobid: The job id returned by sbatch
+        :param submission: The submission as returned by get_submissions()
+        """
+        jobs = parse_jobs(self.config)
+        jobs.append({
+            'jobid': jobid,
+            'array': submission['array'],
+            'offset': submission['offset'],
+            'step': submission.get('step', 1),
+            'bundle': self.config['cluster']['bundle'],
+            'jobs': self.config.get('jobs'),
+            'dependency': submission.get('dependency'),
+            'submitted': time.strftime('%Y-%m-%dT%H:%M:%S')
+        })
+        with open(get_jobs_filename(self.config), 'w') as out_file:
+            json.dump(jobs, out_file, indent=4)
+
+    def __getstate__(self):
+        """
+        A prepared run can be sent to another process (e.g. by a campaign), without its templates, which are only needed
+        to write its files.
+        """
+        state = dict(self.__dict__)
+        for name in ['env', 'template', 'jobtemplate', 'localtemplate', 'context', 'writer']:
+            state.pop(name, None)
+        return state
+
+    def get_local_executor(self, upstream=None):
+        """
+        Get the executor of the jobs on the local machine.
+        :param upstream: The executor of the preceding stage, if this is a later stage of a pipeline
+        :return: The executor
+        """
+        if upstream is None:
+            return LocalExecutor(self.config, self.get_sh_filename(), self.get_job_range(), self._cpu_count())
+        if self.config['stage']['dependency'] == 'aftercorr':
+            # only the array tasks whose upstream jobs run
+            running = set(upstream.iterators)
+            requires = {iterator: [i for i in get_upstream_iterators(self.config['stage'], iterator) if i in running]
+                        for iterator in self.get_array_range()}
+            requires = {iterator: required for iterator, required in requires.items() if required}
+            executor = LocalExecutor(self.config, self.get_sh_filename(), sorted(requires), self._cpu_count())
+            executor.depend_on(upstream, requires)
+        else:
+            executor = LocalExecutor(self.config, self.get_sh_filename(), self.get_array_range(), self._cpu_count())
+            executor.depend_on(upstream)
+        return executor
+
+    def get_array_range(self):
+        """
+        Get the iterators of all jobs defined by the array configuration
+        :return: The range of iterators
+        """
+        return range(
+            self.config['array']['first'],
+            self.config['array']['last'] + self.config['array']['step'],
+            self.config['array']['step']
+        )
+
+    def get_job_range(self):
+        """
+        Get the iterators of the jobs to run, which are the jobs selected by the jobs option or all jobs of the array
+        :return: The RangeSet of iterators
+        """
+        if self.config.get('jobs') is not None:
+            return RangeSet.parse(self.config['jobs'])
+        return RangeSet(self.get_array_range())
+
+    def get_bundle(self, iterator):
+        """
+        Get the slurm array task which runs a job, if consecutive jobs are bundled into one slurm array task.
+        :param iterator: The iterator of the job
+        :return: The index of the bundle
+        """
+        position = (iterator - self.config['array']['first']) // self.config['array']['step']
+        return position // self.config['cluster']['bundle']
+
+    def get_config_copy(self, iterator=None):
+        """
+        Get the variables of the configuration for rendering a template, adding some dependent variables. The
+        configuration itself is shared read-only, only the dependent variables are copied.
+        :param iterator: Make iterator available in configuration as variable.
+        :return: The mapping of variables
+        """
+        return self.context.get(iterator)
 
     def get_output_filename(self, iterator):
         """
@@ -165,10 +618,7 @@ class Cluster:
         :param iterator: The number of the input file
         :return: The file name
         """
-        fname = os.path.join(
-            self.config['output_directory'], self.config['project_name'], 'inputfiles', self.config['inputfile']
-        )
-        return os.path.splitext(fname)[0] + '-{:d}'.format(iterator) + os.path.splitext(fname)[1]
+        return get_input_filename(self.config, iterator)
 
     def get_sh_filename(self, filetype='job'):
         """
@@ -182,6 +632,25 @@ class Cluster:
             self.config['project_name'] + '.' + filetype + '.sh'
         )
 
+    def get_staging_directory(self):
+        """
+        Create a staging directory for the files of the run, in the staging_directory of the settings (e.g. on a
+        local disk) or in the project directory.
+        :return: The directory
+        """
+        if self.settings.get('staging_directory'):
+            directory = os.path.expanduser(self.settings['staging_directory'])
+            os.makedirs(directory, exist_ok=True)
+            return tempfile.mkdtemp(prefix='pycluster-{}-'.format(self.config['project_name']), dir=directory)
+        return tempfile.mkdtemp(prefix='.staging-', dir=get_project_path(self.config))
+
+    def get_config_filename(self):
+        """
+        Get the filename of the configuration stored alongside the job files
+        :return: The file name
+        """
+        return get_project_path(self.config, 'bash', self.config['project_name'] + '.cluster.json')
+
     def _cpu_count(self, max_cpus=None):
         """
         Counts number of CPUs in the system
@@ -226,9 +695,8 @@ class Cluster:
             else:
                 return int(timesplit[0])
 
-        def get_num_jobs():
-            return int(float(self.config['array']['last'] - self.config['array']['first']) /
-                       float(self.config['array']['step']))
+        def get_num_array_tasks():
+            return sum(len(expand_range(submission['array'])) for submission in self.get_submissions())
 
         # make user confirm priority queue usage
         if self.priority_queue:
@@ -252,50 +720,14 @@ class Cluster:
                 return False
 
         # make user confirm submission with a large number of jobs
-        if get_num_jobs() >= 1000:
+        if get_num_array_tasks() >= 1000:
             question = 'Warning:\n' \
                        'You are about to submit {:d} jobs. Submitting a large number of jobs slows down the ' \
-                       'cluster and does not use resources in an optimal way. >>> Do you want to ' \
-                       'continue?'.format(get_num_jobs())
+                       'cluster and does not use resources in an optimal way. Consider bundling several jobs into ' \
+                       'one array task with the --bundle option. >>> Do you want to ' \
+                       'continue?'.format(get_num_array_tasks())
             if not parseynanswer(question):
                 return False
 
         return True
 
-
-class InteractiveCluster:
-    def __init__(self, partition=None, dry=False):
-        """
-        The constructor of the cluster class takes care of all preparation necessary before connecting in an
-        interactive session to the cluster, in particular interactively asking all parameters.
-        :param partition: The partition to connect to.
-        :param dry: Dry run: just output the correct bash command.
-        """
-        self.settings = parse_settings()
-        self.partition = partition if partition is not None else self.settings['partitions'][-1]['name']
-        assert not self.partition == 'local'
-        self.dry = dry
-
-        # determine slurm configuration in advance
-        self.partition_idx = get_partition_idx(self.settings, self.partition)
-        self.slurmconf = self.settings['partitions'][self.partition_idx]['slurmconf']
-        if 'job_init_command' in self.settings and self.settings['job_init_command']:
-            self.job_init_command = self.settings['job_init_command'] + '; '
-        else:
-            self.job_init_command = ''
-
-        # get parameters interactively
-        self.mem = variableinput('Memory', default='1024M')
-        self.mincpus = typedvariableinput('Minimum CPUs', 1, int)
-        self.workstation = variableinput('Workstation', default='any')
-        self.jobname = 'Interactive session (PyCluster)'
-
-    def run(self):
-        command = '{}export SLURM_CONF={};' \
-                  'srun -n 1 --pty --x11 --job-name "{}" -p "{}" --mem "{}" --mincpus "{:d}"'.format(
-            self.job_init_command, self.slurmconf, self.jobname, self.partition, self.mem, self.mincpus
-        )
-        if self.workstation != 'any':
-            command += ' -w {}'.format(self.workstation)
-        command += ' bash'
-        subprocess.run(command, shell=True, executable='/bin/bash')
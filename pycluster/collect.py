@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from jinja2 import Template
+from pycluster.config import *
+from pycluster.context import *
+from pycluster.ranges import *
+from pycluster.generate import Progress
+
+__all__ = [
+    'collect_outputs',
+    'COLLECT_MODES'
+]
+
+COLLECT_MODES = ['concat', 'sum', 'npy']
+
+
+def _import_numpy(mode):
+    try:
+        import numpy
+    except ImportError:
+        print('Collecting outputs in {} mode requires numpy. Please install it with <pip install numpy>.'.format(mode))
+        sys.exit(1)
+    return numpy
+
+
+def _read_array(fname, columns=None):
+    """
+    Read the output of a job as array. Files ending with .npy are read with numpy, other files are read as text
+    table, where lines starting with # are comments and the values are separated by commas or whitespace.
+    :return: The comment lines at the beginning of the file, the delimiter and the array
+    """
+    import numpy
+    if fname.endswith('.npy'):
+        header, delimiter, data = [], None, numpy.load(fname)
+    else:
+        header = []
+        delimiter = None
+        with open(fname) as in_file:
+            for line in in_file:
+                if line.startswith('#'):
+                    header.append(line)
+                elif line.strip():
+                    delimiter = ',' if ',' in line else None
+                    break
+        data = numpy.loadtxt(fname, delimiter=delimiter, comments='#', ndmin=2)
+    if columns is not None:
+        data = data[..., columns]
+    return header, delimiter, data
+
+
+def _read_text(fnames):
+    results = []
+    for fname in fnames:
+        with open(fname, 'rb') as in_file:
+            data = in_file.read()
+        if data and not data.endswith(b'\n'):
+            data += b'\n'
+        results.append(data)
+    return results
+
+
+def _read_arrays(fnames, columns=None):
+    return [_read_array(fname, columns)[2] for fname in fnames]
+
+
+def _sum_arrays(fnames, columns=None):
+    """
+    Sum the outputs of several jobs. If columns are given, only these columns are summed, the other columns are taken
+    from the first file (e.g. the indices of the bins of a scoring mesh).
+    """
+    header, delimiter, total = _read_array(fnames[0])
+    total = total.astype(float)
+    for fname in fnames[1:]:
+        data = _read_array(fname)[2]
+        if data.shape != total.shape:
+            raise ValueError('The output {} has shape {}, but previous outputs have shape {}.'.format(
+                fname, data.shape, total.shape))
+        if columns is None:
+            total += data
+        else:
+            total[..., columns] += data[..., columns]
+    return header, delimiter, total
+
+
+def _ordered_map(function, chunks, workers, processes):
+    """
+    Apply a function to chunks in parallel. Only a few chunks are read ahead, so the results of all chunks are never
+    held in memory at the same time.
+    :return: Generator of the results in the order of the chunks
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield function(*chunk)
+        return
+    executor_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_type(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, *chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _load_state(fname):
+    try:
+        with open(fname) as in_file:
+            return json.load(in_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(fname, state):
+    with open(fname + '.tmp', 'w') as out_file:
+        json.dump(state, out_file, indent=4)
+    os.replace(fname + '.tmp', fname)
+
+
+def collect_outputs(config, iterators, collect, workers=1, restart=False):
+    """
+    Merge the outputs of all jobs of a cluster run into a single file. The outputs are read in parallel and merged
+    one after the other, so they are never held in memory at the same time. Outputs merged by a previous call are not
+    read again, only the outputs of newly finished jobs are added.
+    :param config: The cluster configuration
+    :param iterators: The iterators of all jobs
+    :param collect: Dict with the output file of every job relative to the project directory (input, a template using
+    e.g. {{ iterator }}), the merged file relative to the project directory (output), how to merge (mode: 'concat'
+    appends the files in the order of the jobs, 'sum' sums the values of text tables or .npy arrays, 'npy' stacks the
+    arrays into a .npy file with one row per job, missing jobs are NaN) and optionally the columns to sum or stack
+    :param workers: Number of threads (concat) or processes (sum and npy) to read the outputs with
+    :param restart: Merge all outputs again instead of adding the outputs of newly finished jobs
+    :return: The iterators whose output is missing
+    """
+    mode = collect.get('mode', 'concat')
+    if mode not in COLLECT_MODES:
+        print('The collect mode {} is not known. Please use "{}".'.format(mode, '", "'.join(COLLECT_MODES)))
+        sys.exit(1)
+    columns = collect.get('columns')
+    iterators = list(iterators)
+    output = get_project_path(config, collect['output'])
+    state_filename = output + '.collect.json'
+    state = _load_state(state_filename)
+    key = {'input': collect['input'], 'mode': mode, 'columns': columns, 'iterators': compress_range(iterators)}
+    if restart or state is None or state['key'] != key or not os.path.exists(output):
+        state = {'key': key, 'merged': ''}
+    merged = set(expand_range(state['merged']))
+
+    # find the outputs of jobs that finished since the last merge
+    template = Template(collect['input'])
+    context = RenderContext(dict(config, random_seed=config.get('random_seed')), config.get('cores_local'))
+
+    def find_outputs():
+        pending = [iterator for iterator in iterators if iterator not in merged]
+        fnames = [get_project_path(config, template.render(context.get(iterator))) for iterator in pending]
+        with ThreadPoolExecutor(max_workers=max(1, min(32, workers * 4))) as executor:
+            exists = list(executor.map(os.path.exists, fnames))
+        return ([(iterator, fname) for iterator, fname, found in zip(pending, fnames, exists) if found],
+                [iterator for iterator, found in zip(pending, exists) if not found])
+
+    available, missing = find_outputs()
+    if mode == 'concat' and merged and (state.get('size') is None or os.path.getsize(output) < state['size'] or
+                                        (available and available[0][0] < max(merged))):
+        # appending would break the order of the jobs (or the merged file was changed), so it is merged again
+        print('All outputs are concatenated again to keep the order of the jobs.')
+        merged = set()
+        available, missing = find_outputs()
+
+    print('Collecting {:d} new outputs ({:d} merged before) into {} ({}).'.format(
+        len(available), len(merged), output, mode))
+    chunksize = max(1, min(64, len(available) // (max(1, workers) * 8)))
+    chunks = [available[i:i + chunksize] for i in range(0, len(available), chunksize)]
+    progress = Progress(len(available), 'outputs')
+
+    if mode == 'concat':
+        # new outputs are appended after the size recorded in the state, so that the bytes of an append that did not
+        # finish are overwritten, a file merged from scratch replaces the output only when it is complete
+        with open(output if merged else output + '.tmp', 'r+b' if merged else 'wb') as out_file:
+            if merged:
+                out_file.truncate(state['size'])
+                out_file.seek(state['size'])
+            results = _ordered_map(_read_text, [([fname for _, fname in chunk],) for chunk in chunks], workers, False)
+            for chunk, result in zip(chunks, results):
+                for data in result:
+                    out_file.write(data)
+                progress.update(len(chunk))
+            state['size'] = out_file.tell()
+        if not merged:
+            os.replace(output + '.tmp', output)
+    elif mode == 'sum' and available:
+        numpy = _import_numpy(mode)
+        if merged:
+            header, delimiter, total = _read_array(output)
+        else:
+            header, delimiter, total = None, None, None
+        results = _ordered_map(_sum_arrays, [([fname for _, fname in chunk], columns) for chunk in chunks],
+                               workers, True)
+        try:
+            for chunk, (chunk_header, chunk_delimiter, chunk_total) in zip(chunks, results):
+                if total is None:
+                    header, delimiter, total = chunk_header, chunk_delimiter, chunk_total
+                elif chunk_total.shape != total.shape:
+                    raise ValueError('The outputs of the jobs {} have shape {}, but the merged output has shape '
+                                     '{}.'.format(compress_range(iterator for iterator, _ in chunk),
+                                                  chunk_total.shape, total.shape))
+                elif columns is None:
+                    total += chunk_total
+                else:
+                    total[..., columns] += chunk_total[..., columns]
+                progress.update(len(chunk))
+        except ValueError as e:
+            print('\n' + str(e))
+            sys.exit(1)
+        if output.endswith('.npy'):
+            numpy.save(output + '.tmp.npy', total)
+            os.replace(output + '.tmp.npy', output)
+        else:
+            numpy.savetxt(output + '.tmp', total.reshape(-1, total.shape[-1]) if total.ndim > 1 else total,
+                          fmt='%.15g', delimiter=delimiter if delimiter is not None else ' ',
+                          header=''.join(header).rstrip('\n'), comments='')
+            os.replace(output + '.tmp', output)
+    elif mode == 'npy' and available:
+        numpy = _import_numpy(mode)
+        position = {iterator: i for i, iterator in enumerate(iterators)}
+        if merged:
+            stack = numpy.lib.format.open_memmap(output, mode='r+')
+        else:
+            shape = _read_array(available[0][1], columns)[2].shape
+            stack = numpy.lib.format.open_memmap(output, mode='w+', dtype=float, shape=(len(iterators),) + shape)
+            stack[:] = numpy.nan
+        results = _ordered_map(_read_arrays, [([fname for _, fname in chunk], columns) for chunk in chunks],
+                               workers, True)
+        for chunk, arrays in zip(chunks, results):
+            for (iterator, fname), data in zip(chunk, arrays):
+                if data.shape != stack.shape[1:]:
+                    print('The output {} has shape {}, but the merged output expects shape {}.'.format(
+                        fname, data.shape, stack.shape[1:]))
+                    sys.exit(1)
+                stack[position[iterator]] = data
+            progress.update(len(chunk))
+        stack.flush()
+        del stack
+    if available:
+        progress.finish()
+
+    merged.update(iterator for iterator, _ in available)
+    state['merged'] = compress_range(sorted(merged))
+    _save_state(state_filename, state)
+    if missing:
+        print('{:d} of {:d} outputs are missing: <{}>.'.format(len(missing), len(iterators), compress_range(missing)))
+    else:
+        print('All {:d} outputs are merged.'.format(len(iterators)))
+    return missing
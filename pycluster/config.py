@@ -5,7 +5,14 @@ import os
 __all__ = [
     'parse_config',
     'parse_settings',
-    'get_partition_idx'
+    'get_partition_idx',
+    'get_project_path',
+    'get_shard',
+    'get_shards',
+    'get_input_filename',
+    'get_log_filename',
+    'get_output_path',
+    'get_cache_directory'
 ]
 
 
@@ -27,6 +34,8 @@ def parse_config(filename, configtype):
             msg += ' Please create a cluster configuration file in the /configs folder.'
         elif configtype == 'settings':
             msg += ' A settings file is required. Please restore it from the repository.'
+        elif configtype == 'jobs':
+            msg += ' No jobs were submitted for this configuration.'
         print(msg)
         sys.exit(1)
     return data
@@ -57,3 +66,84 @@ def get_partition_idx(settings, partition):
     msg = 'The partition {} was not found in the settings.json configuration.'.format(partition)
     print(msg)
     sys.exit(1)
+
+
+def get_project_path(config, *paths):
+    """
+    Returns a path inside the output directory of a cluster run.
+    :param config: The cluster configuration
+    :param paths: Path components to append to the project directory
+    :return: The joined path
+    """
+    return os.path.join(config['output_directory'], config['project_name'], *paths)
+
+
+def get_shard(config, iterator):
+    """
+    Get the subdirectory of the input, log and err files of the n-th job. If shard_size is given in the configuration,
+    the files are split into subdirectories of shard_size jobs each (000, 001, ...), so that no directory holds the
+    files of all jobs.
+    :param config: The cluster configuration
+    :param iterator: The number of the job
+    :return: The name of the subdirectory or '' if the files are not split
+    """
+    if not config.get('shard_size'):
+        return ''
+    return '{:03d}'.format(iterator // config['shard_size'])
+
+
+def get_shards(config, iterators):
+    """
+    Get the subdirectories of the input, log and err files of some jobs.
+    :param config: The cluster configuration
+    :param iterators: The numbers of the jobs
+    :return: The sorted names of the subdirectories (empty if the files are not split)
+    """
+    if not config.get('shard_size'):
+        return []
+    return sorted(set(get_shard(config, iterator) for iterator in iterators))
+
+
+def get_input_filename(config, iterator):
+    """
+    Get the file name of the n-th input file
+    :param config: The cluster configuration
+    :param iterator: The number of the input file
+    :return: The file name
+    """
+    name, extension = os.path.splitext(config['inputfile'])
+    return get_project_path(config, 'inputfiles', get_shard(config, iterator),
+                            '{}-{:d}{}'.format(name, iterator, extension))
+
+
+def get_log_filename(config, iterator, logtype='log'):
+    """
+    Get the file name of the log file of the n-th job
+    :param config: The cluster configuration
+    :param iterator: The number of the job
+    :param logtype: 'log' for stdout or 'err' for stderr
+    :return: The file name
+    """
+    return get_project_path(config, logtype, get_shard(config, iterator),
+                            '{}_{:d}.{}'.format(config['project_name'], iterator, logtype))
+
+
+def get_output_path(config):
+    """
+    Get the directory the jobs write their outputs to, which is available as output_path in the templates.
+    :param config: The cluster configuration
+    :return: The project directory or '.' (the working directory of each job) if the jobs run in node-local scratch
+    """
+    if config.get('scratch'):
+        return '.'
+    return get_project_path(config)
+
+
+def get_cache_directory(*paths):
+    """
+    Returns a path inside the cache directory of the user (~/.cache/pycluster unless XDG_CACHE_HOME is set).
+    :param paths: Path components to append to the cache directory
+    :return: The joined path
+    """
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache, 'pycluster', *paths)
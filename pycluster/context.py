@@ -0,0 +1,109 @@
+from collections import ChainMap
+from pycluster.config import get_output_path
+from pycluster.custom_filters import task_random
+from pycluster.sweep import Sweep
+from pycluster.pipeline import get_upstream_iterators
+
+__all__ = [
+    'FrozenDict',
+    'FrozenList',
+    'freeze',
+    'RenderContext'
+]
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError('The configuration is read-only and cannot be modified inside a template.')
+
+
+class FrozenDict(dict):
+    """
+    A dict that cannot be modified. It renders and serializes exactly like a dict.
+    """
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class FrozenList(list):
+    """
+    A list that cannot be modified. It renders and serializes exactly like a list.
+    """
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = clear = extend = insert = pop = remove = reverse = sort = _readonly
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value):
+    """
+    Recursively convert dicts and lists to their read-only counterparts.
+    :param value: The value to convert
+    :return: The read-only value
+    """
+    if isinstance(value, FrozenDict) or isinstance(value, FrozenList):
+        return value
+    elif isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    elif isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+class RenderContext:
+    def __init__(self, config, cores_local=None):
+        """
+        The variables available in the templates. All tasks share one read-only copy of the configuration, on top of
+        which every task gets a small layer with its dependent variables (e.g. the iterator). This avoids copying
+        the whole configuration for every task, while no template can modify the configuration seen by other tasks.
+        :param config: The cluster configuration
+        :param cores_local: Number of local CPUs made available as variable.
+        """
+        self.base = freeze(dict(config, cores_local=cores_local, output_path=get_output_path(config)))
+        self.sweep = Sweep(self.base['sweep']) if 'sweep' in self.base else None
+
+    def get_parameters(self, iterator):
+        """
+        Get the sweep parameters of a task. The array cycles through all points of the sweep, if the array is longer
+        than the sweep, the sweep is repeated.
+        :param iterator: The iterator of the task
+        :return: The index of the point of the sweep, the number of the repetition and the dict of parameters
+        """
+        position = (iterator - self.base['array']['first']) // self.base['array']['step']
+        repetition, sweep_index = divmod(position, len(self.sweep))
+        return sweep_index, repetition, self.sweep.get(sweep_index)
+
+    def get(self, iterator=None, **variables):
+        """
+        Get the variables of a single task.
+        :param iterator: Make iterator available in configuration as variable.
+        :param variables: Additional variables of this task
+        :return: A mapping of all variables, new variables are only stored in the layer of this task
+        """
+        layer = {
+            'iterator': iterator,
+            'random_state': task_random(self.base['random_seed'], iterator)
+        }
+        if self.sweep is not None and iterator is not None:
+            sweep_index, repetition, parameters = self.get_parameters(iterator)
+            layer.update(parameters)
+            layer.update(parameters=FrozenDict(parameters), sweep_index=sweep_index, repetition=repetition)
+        if 'stage' in self.base and self.base['stage']['dependency'] == 'aftercorr' and iterator is not None:
+            layer['upstream_iterators'] = FrozenList(get_upstream_iterators(self.base['stage'], iterator))
+        layer.update(variables)
+        return ChainMap(layer, self.base)
@@ -1,8 +1,9 @@
 import json
 import os
-from pycluster import *
+from pycluster.userinput import *
 from jinja2 import Template
 import getpass
+import random
 
 
 class CreateConfig:
@@ -41,6 +42,10 @@ class CreateConfig:
             if key != 'array' and key != 'cluster':
                 self.config[key] = self.get_user_input(self.config, key)
 
+        # Draw the master seed for the random filters, so that all input files of this run can be reproduced
+        if 'random_seed' not in self.config:
+            self.config['random_seed'] = random.SystemRandom().randint(0, 2**31 - 1)
+
         # Generate projectname and output directory (they may depend on other values)
         self.config['project_name'] = Template(self.config['project_name']).render(self.config)
         self.config['output_directory'] = Template(self.config['output_directory']).render(self.config)
@@ -1,15 +1,25 @@
 import os
 import random
+from pycluster.filecache import FileCache
+try:
+    from jinja2 import pass_context
+except ImportError:  # Jinja2 < 3.0
+    from jinja2 import contextfilter as pass_context
 
 
 __all__ = [
     'setup_filters',
+    'task_random',
     'filter_filesize',
     'filter_randomint',
     'filter_randomfloat',
-    'filter_readtxt'
+    'filter_readtxt',
+    'get_read_files'
 ]
 
+# files read by the templates, shared by all tasks rendered in this process
+_file_cache = FileCache()
+
 
 def setup_filters(env):
     env.filters['splitext'] = os.path.splitext
@@ -20,34 +30,60 @@ def setup_filters(env):
     return env
 
 
-def filter_filesize(fname):
-    return os.path.getsize(fname)
+def task_random(seed, iterator):
+    """
+    Get the random number generator of a single task. The stream only depends on the master seed of the run and the
+    iterator, so that every input file can be reproduced independently of the other tasks.
+    :param seed: The master seed of the cluster run
+    :param iterator: The iterator of the task
+    :return: A random.Random instance
+    """
+    return random.Random('{}:{}'.format(seed, iterator))
+
+
+def get_read_files():
+    """
+    Get the files read by the readtxt and filesize filters in this process.
+    :return: Dict of the modification time (ns) and size of every file by its absolute file name
+    """
+    return dict(_file_cache.files)
+
 
+# the file filters take the context only so that jinja never evaluates them with constant arguments when compiling:
+# the compiled template would keep the file content, also in the bytecode cache, and the file would not be tracked
+@pass_context
+def filter_filesize(context, fname):
+    return _file_cache.filesize(fname)
 
-def _helper_random(x, seed, generator, datatype):
+
+def _helper_random(context, x, seed, method, datatype):
     if seed is not None:
-        random.seed(seed)
+        generator = random.Random(seed)
+    elif context.get('random_state') is not None:
+        generator = context.get('random_state')
+    else:
+        generator = random
     if isinstance(x, list):
-        return generator(datatype(x[0]), datatype(x[1]))
+        return getattr(generator, method)(datatype(x[0]), datatype(x[1]))
     else:
-        return generator(0, datatype(x))
+        return getattr(generator, method)(0, datatype(x))
 
 
-def filter_randomint(x, seed=None):
-    return _helper_random(x, seed, random.randint, int)
+@pass_context
+def filter_randomint(context, x, seed=None):
+    return _helper_random(context, x, seed, 'randint', int)
 
 
-def filter_randomfloat(x, seed=None):
-    return _helper_random(x, seed, random.uniform, float)
+@pass_context
+def filter_randomfloat(context, x, seed=None):
+    return _helper_random(context, x, seed, 'uniform', float)
 
 
-def filter_readtxt(arg):
+@pass_context
+def filter_readtxt(context, arg):
     if type(arg) is not list:
         arg = [arg]
-    with open(arg[0], 'r') as fp:
-        lines = fp.readlines()
-        if len(arg) == 2:
-            return lines[arg[1]-1]
-        else:
-            return ' '.join(lines)
-
+    if len(arg) == 2:
+        return _file_cache.readline(arg[0], arg[1])
+    else:
+        return _file_cache.read(arg[0])
@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+from collections import deque
+from pycluster.config import *
+from pycluster.ranges import *
+from pycluster.worker import get_worker_filename
+
+__all__ = [
+    'LocalExecutor'
+]
+
+
+class LocalExecutor:
+    def __init__(self, config, jobfile, iterators, tasks_parallel):
+        """
+        Runs the jobs of a job array on the local machine. Unlike waves of jobs, a new job is started as soon as any
+        running job finishes, so that always tasks_parallel jobs are running.
+        :param config: The cluster configuration
+        :param jobfile: The job bash file to execute for every job
+        :param iterators: The iterators of the jobs to run
+        :param tasks_parallel: Number of jobs to run in parallel
+        """
+        self.config = config
+        self.jobfile = jobfile
+        self.iterators = list(iterators)
+        self.tasks_parallel = max(1, tasks_parallel)
+        self.results = {}
+        self.skipped = []
+        self.ready = deque(self.iterators)
+        self.upstream = None
+        self.downstream = []
+        self.worker = None
+        self._remaining = None
+        self._dependents = None
+        self._upstream_done = 0
+
+    def start(self, iterator):
+        """
+        Start a single job in the background, or hand it to the python workers if the run uses them.
+        :param iterator: The iterator of the job
+        :return: The process and its log files (None for jobs of the python workers)
+        """
+        if self.config.get('worker'):
+            if self.worker is None:
+                self.worker = _PythonWorker(self.config, self.tasks_parallel)
+            return self.worker.submit(iterator), None, None, time.time()
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(iterator), PYCLUSTER_TASK_ID=str(iterator))
+        logfile = open(get_log_filename(self.config, iterator, 'log'), 'w')
+        errfile = open(get_log_filename(self.config, iterator, 'err'), 'w')
+        process = subprocess.Popen(['/bin/bash', self.jobfile], env=env, stdout=logfile, stderr=errfile,
+                                   stdin=subprocess.DEVNULL)
+        return process, logfile, errfile, time.time()
+
+    def depend_on(self, upstream, requires=None):
+        """
+        Let the jobs wait for the jobs of the preceding stage of a pipeline, like slurm dependencies. Jobs whose
+        required jobs failed or were skipped are skipped.
+        :param upstream: The executor of the preceding stage
+        :param requires: Dict of the iterators of the upstream jobs required by every job (aftercorr), if None every
+        job requires all upstream jobs (afterok)
+        """
+        self.upstream = upstream
+        upstream.downstream.append(self)
+        self.ready = deque()
+        if requires is None:
+            if not upstream.iterators:
+                self.ready.extend(self.iterators)
+            return
+        self._remaining = {}
+        self._dependents = {}
+        for iterator in self.iterators:
+            self._remaining[iterator] = len(requires[iterator])
+            for required in requires[iterator]:
+                self._dependents.setdefault(required, []).append(iterator)
+            if not requires[iterator]:
+                self.ready.append(iterator)
+
+    def _upstream_finished(self, iterator, success):
+        """
+        Called when a job of the preceding stage finished or was skipped.
+        """
+        if self._dependents is None:
+            # afterok: all jobs wait for all upstream jobs, and are skipped as soon as any of them failed
+            self._upstream_done += 1
+            if not success and not self.skipped:
+                self._skip(list(self.iterators))
+            elif self._upstream_done == len(self.upstream.iterators) and not self.skipped:
+                self.ready.extend(self.iterators)
+            return
+        for dependent in self._dependents.get(iterator, []):
+            if self._remaining[dependent] is None:
+                continue
+            if not success:
+                self._remaining[dependent] = None
+                self._skip([dependent])
+            else:
+                self._remaining[dependent] -= 1
+                if self._remaining[dependent] == 0:
+                    self.ready.append(dependent)
+
+    def _skip(self, iterators):
+        self.skipped += iterators
+        for iterator in iterators:
+            for executor in self.downstream:
+                executor._upstream_finished(iterator, False)
+
+    def _finished(self, iterator, returncode, walltime):
+        self.results[iterator] = {'returncode': returncode, 'walltime': walltime}
+        for executor in self.downstream:
+            executor._upstream_finished(iterator, returncode == 0)
+
+    def run(self, stages=()):
+        """
+        Run all jobs and wait for them to finish. Exit code and wall time of every job are written to
+        bash/<project_name>.local.json.
+        :param stages: The executors of the later stages of a pipeline. Their jobs run together with the jobs of this
+        executor as soon as the jobs they depend on succeeded.
+        :return: True if all jobs succeeded
+        """
+        executors = [self] + list(stages)
+        total = sum(len(executor.iterators) for executor in executors)
+        if stages:
+            print('   🚀   Running {:d} jobs of {:d} stages locally, {:d} in parallel.'.format(
+                total, len(executors), self.tasks_parallel))
+        else:
+            print('   🚀   Running {:d} jobs locally, {:d} in parallel.'.format(total, self.tasks_parallel))
+        running = {}
+        start = time.time()
+        last_print = 0.
+        try:
+            while any(executor.ready for executor in executors) or running:
+                # later stages first, so that their jobs start as soon as the jobs they need are done
+                for executor in reversed(executors):
+                    while executor.ready and len(running) < self.tasks_parallel:
+                        iterator = executor.ready.popleft()
+                        running[(executor, iterator)] = executor.start(iterator)
+                finished = False
+                for (executor, iterator), (process, logfile, errfile, started) in list(running.items()):
+                    if process.poll() is not None:
+                        if logfile is not None:
+                            logfile.close()
+                            errfile.close()
+                        del running[(executor, iterator)]
+                        executor._finished(iterator, process.returncode, round(time.time() - started, 3))
+                        finished = True
+                now = time.time()
+                if now - last_print >= 1. or not (any(executor.ready for executor in executors) or running):
+                    last_print = now
+                    self.print_status(executors, now - start, len(running))
+                if not finished:
+                    time.sleep(0.05)
+        except KeyboardInterrupt:
+            for process, logfile, errfile, started in running.values():
+                process.terminate()
+                process.wait()
+                if logfile is not None:
+                    logfile.close()
+                    errfile.close()
+            print('\n   🛑   Interrupted, {:d} jobs were terminated.'.format(len(running)))
+        finally:
+            for executor in executors:
+                if executor.worker is not None:
+                    executor.worker.close()
+        sys.stdout.write('\n')
+
+        success = True
+        for executor in executors:
+            executor.write_report()
+            failed = sorted(iterator for iterator, result in executor.results.items() if result['returncode'] != 0)
+            name = ' of {}'.format(executor.config['project_name']) if stages else ''
+            if failed:
+                print('   💥   {:d} jobs{} failed: <{}>.'.format(len(failed), name, compress_range(failed)))
+            if executor.skipped:
+                print('   ⏭️   {:d} jobs{} were skipped, because jobs they depend on failed: <{}>.'.format(
+                    len(executor.skipped), name, compress_range(executor.skipped)))
+            success = success and not failed and len(executor.results) == len(executor.iterators)
+        if success:
+            print('   🏁   Done running {:d} jobs.'.format(total))
+        return success
+
+    @staticmethod
+    def print_status(executors, elapsed, num_running):
+        done = sum(len(executor.results) for executor in executors)
+        total = sum(len(executor.iterators) - len(executor.skipped) for executor in executors)
+        failed = sum(1 for executor in executors for result in executor.results.values() if result['returncode'] != 0)
+        rate = done / elapsed if elapsed > 0 else 0.
+        if rate > 0:
+            eta = time.strftime('%H:%M:%S', time.gmtime((total - done) / rate))
+        else:
+            eta = '--:--:--'
+        sys.stdout.write('\r   🏃   {:d}/{:d} done ({:d} failed), {:d} running, {:.2f} jobs/min, ETA {}   '.format(
+            done, total, failed, num_running, rate * 60., eta))
+        sys.stdout.flush()
+
+    def write_report(self):
+        """
+        Writes the results of the jobs to bash/<project_name>.local.json. The results of jobs that did not run this
+        time (e.g. with the jobs option) are kept, as resume reads the exit codes of all jobs from the report.
+        """
+        fname = get_project_path(self.config, 'bash', self.config['project_name'] + '.local.json')
+        results = {}
+        try:
+            with open(fname) as in_file:
+                results = {int(iterator): result for iterator, result in json.load(in_file).items()}
+        except (OSError, ValueError):
+            pass
+        results.update(self.results)
+        with open(fname + '.tmp', 'w') as out_file:
+            json.dump({str(iterator): result for iterator, result in sorted(results.items())}, out_file, indent=1)
+        os.replace(fname + '.tmp', fname)
+
+
+class _PythonWorker:
+    def __init__(self, config, processes):
+        """
+        The persistent python workers of a run on the local machine (see worker.py), to which jobs are handed one by
+        one. The workers run with the executable of the run, their output outside of jobs is written to
+        bash/<project_name>.worker.err.
+        :param config: The cluster configuration
+        :param processes: Number of worker processes, unless given by the worker options of the configuration
+        """
+        self.returncodes = {}
+        self.errfile = open(get_project_path(config, 'bash', config['project_name'] + '.worker.err'), 'w')
+        config_filename = get_project_path(config, 'bash', config['project_name'] + '.cluster.json')
+        self.process = subprocess.Popen(
+            [config['executable'], get_worker_filename(), config_filename, '--serve', str(processes)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.errfile, universal_newlines=True
+        )
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            iterator, returncode, walltime = line.split()
+            self.returncodes[int(iterator)] = int(returncode)
+
+    def submit(self, iterator):
+        try:
+            self.process.stdin.write('{:d}\n'.format(iterator))
+            self.process.stdin.flush()
+        except OSError:
+            # the workers stopped, the job fails when it is polled
+            pass
+        return _WorkerJob(self, iterator)
+
+    def close(self):
+        """
+        Let the workers finish and stop them.
+        """
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        self.thread.join()
+        self.errfile.close()
+
+
+class _WorkerJob:
+    def __init__(self, worker, iterator):
+        """
+        A job handed to the python workers, which is polled like a process.
+        """
+        self.worker = worker
+        self.iterator = iterator
+        self.returncode = None
+
+    def poll(self):
+        if self.iterator in self.worker.returncodes:
+            self.returncode = self.worker.returncodes[self.iterator]
+        elif self.worker.process.poll() is not None and not self.worker.thread.is_alive():
+            # the workers stopped without running the job
+            self.returncode = 1
+        return self.returncode
+
+    def terminate(self):
+        self.worker.process.terminate()
+
+    def wait(self):
+        self.worker.process.wait()
@@ -0,0 +1,116 @@
+import os
+import re
+import mmap
+import locale
+from array import array
+from itertools import accumulate
+from collections import OrderedDict
+
+__all__ = [
+    'FileCache'
+]
+
+# line ends of text mode (universal newlines), and a carriage return which ends a line on its own
+_LINE_END = re.compile(rb'\r\n|\r|\n')
+_BARE_CR = re.compile(rb'\r(?!\n)')
+
+
+class FileCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        Cache of text files read by the templates. For every file, the cache holds the offsets of its lines, so that
+        a single line is read with a seek instead of reading the whole file. The least recently used files are dropped
+        if the cache grows beyond its size limit. A file is read again if its modification time or size changed.
+        :param max_bytes: Maximum size of the cached line offsets and file contents in bytes
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        # modification time and size of every file read so far, also of files dropped from the cache
+        self.files = {}
+
+    def _get(self, fname):
+        """
+        Get the cache entry of a file, which is reset if the file changed.
+        """
+        stat = os.stat(fname)
+        key = os.path.abspath(fname)
+        self.files[key] = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(key)
+        if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            self._entries.move_to_end(key)
+            return entry
+        if entry is not None:
+            self.nbytes -= entry['nbytes']
+        entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'offsets': None, 'text': None, 'nbytes': 0}
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        return entry
+
+    def _add(self, entry, nbytes):
+        """
+        Account for new data of an entry and drop the least recently used entries if the cache is too large.
+        """
+        entry['nbytes'] += nbytes
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            key, dropped = self._entries.popitem(last=False)
+            self.nbytes -= dropped['nbytes']
+
+    def filesize(self, fname):
+        """
+        Get the size of a file in bytes.
+        :param fname: The file name
+        :return: The size
+        """
+        return self._get(fname)['size']
+
+    def read(self, fname):
+        """
+        Get the content of a file, with its lines joined by spaces.
+        :param fname: The file name
+        :return: The content
+        """
+        entry = self._get(fname)
+        if entry['text'] is None:
+            with open(fname, 'r') as fp:
+                entry['text'] = ' '.join(fp.readlines())
+            self._add(entry, len(entry['text']))
+        return entry['text']
+
+    def readline(self, fname, number):
+        """
+        Get a single line of a file.
+        :param fname: The file name
+        :param number: The number of the line, starting at 1 (0 and negative numbers count from the end)
+        :return: The line including its line break, which is always a newline (like reading the file in text mode)
+        """
+        entry = self._get(fname)
+        if entry['offsets'] is None:
+            entry['offsets'] = self._index(fname, entry['size'])
+            self._add(entry, entry['offsets'].itemsize * len(entry['offsets']))
+        offsets = entry['offsets']
+        i = range(len(offsets) - 1)[number - 1]
+        with open(fname, 'rb') as fp:
+            fp.seek(offsets[i])
+            data = fp.read(offsets[i + 1] - offsets[i])
+        return data.decode(locale.getpreferredencoding(False)).replace('\r\n', '\n').replace('\r', '\n')
+
+    @staticmethod
+    def _index(fname, size):
+        """
+        Scan a file for the offsets of its lines. Lines end with a newline, a carriage return or both, like in text
+        mode.
+        :return: Array of the offset of every line and the size of the file
+        """
+        offsets = array('q', [0])
+        if size > 0:
+            with open(fname, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if _BARE_CR.search(mm) is None:
+                    offsets.extend(accumulate(map(len, iter(mm.readline, b''))))
+                else:
+                    # lines ending with a carriage return only are rare enough to take the slower scan
+                    offsets.extend(match.end() for match in _LINE_END.finditer(mm))
+                    if offsets[-1] != size:
+                        offsets.append(size)
+        return offsets
@@ -0,0 +1,339 @@
+import os
+import math
+import hashlib
+import sys
+import time
+import tempfile
+from jinja2 import Environment, FileSystemLoader, ModuleLoader, FileSystemBytecodeCache, meta
+from pycluster.custom_filters import *
+from pycluster.config import *
+from pycluster.pack import *
+from pycluster.context import *
+from pycluster.writer import *
+
+__all__ = [
+    'get_environment',
+    'compile_template',
+    'get_frozen_template',
+    'render_inputfile',
+    'get_digest',
+    'get_template_digest',
+    'get_pack_filename',
+    'extract_inputfile',
+    'generate_inputfiles',
+    'Progress'
+]
+
+# state of a worker process, set up once by _init_worker
+_worker = {}
+
+
+class _BytecodeCache(FileSystemBytecodeCache):
+    """
+    Bytecode cache which replaces cache files atomically, so that concurrent runs never read a partially written file.
+    """
+    def dump_bytecode(self, bucket):
+        name = self._get_cache_filename(bucket)
+        with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(name), suffix='.tmp', delete=False) as f:
+            bucket.write_bytecode(f)
+        os.replace(f.name, name)
+
+
+def _get_bytecode_cache():
+    """
+    Get the cache of compiled templates in the cache directory of the user, which saves compiling the templates again
+    on every invocation. No cache is used if the directory is not writable.
+    """
+    directory = get_cache_directory('templates')
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(directory, os.W_OK):
+        return None
+    return _BytecodeCache(directory)
+
+
+def get_environment():
+    """
+    Create the template environment of the templates folder with all custom filters.
+    :return: The jinja2 Environment
+    """
+    env = Environment(
+        loader=FileSystemLoader(os.path.abspath(os.path.join(os.path.dirname(__file__), '../templates'))),
+        bytecode_cache=_get_bytecode_cache()
+    )
+    return setup_filters(env)
+
+
+def compile_template(env, name, target, writer=None):
+    """
+    Compile a template of the environment and all templates it includes, imports or extends to python code, so that
+    it can be rendered later without the templates folder. Every module replaces the previous one only when it is
+    complete, as jobs may load the modules at the same time.
+    :param env: The jinja2 Environment
+    :param name: The name of the template
+    :param target: The directory to write the compiled templates to
+    :param writer: A FileWriter to write the modules with (if None, then they are written directly)
+    """
+    os.makedirs(target, exist_ok=True)
+    for template_name, source, filename in _find_templates(env, name):
+        code = env.compile(source, template_name, filename, raw=True, defer_init=True).encode('utf-8')
+        fname = os.path.join(target, ModuleLoader.get_module_filename(template_name))
+        if writer is not None:
+            writer.write(fname, code)
+        else:
+            with tempfile.NamedTemporaryFile('wb', dir=target, suffix='.tmp', delete=False) as f:
+                f.write(code)
+            os.replace(f.name, fname)
+
+
+def get_frozen_template(config):
+    """
+    Get the input file template of a cluster run. If the template was compiled into the bash directory of the run, the
+    compiled template is used, otherwise the template is loaded from the templates folder.
+    :param config: The cluster configuration stored with the run
+    :return: The jinja2 Template
+    """
+    directory = get_project_path(config, 'bash', 'templates')
+    if os.path.isdir(directory):
+        env = setup_filters(Environment(loader=ModuleLoader(directory)))
+    else:
+        env = get_environment()
+    return env.get_template(config['inputfile'])
+
+
+def render_inputfile(config, iterator, output=None):
+    """
+    Render the input file of a single task from the configuration stored with a cluster run. The result is identical
+    to the input file created in advance by Cluster.
+    :param config: The cluster configuration stored with the run
+    :param iterator: The iterator of the task
+    :param output: The file name to write to (if None, then the input file is written to stdout)
+    """
+    template = get_frozen_template(config)
+    text = template.render(RenderContext(config, config.get('cores_local')).get(iterator))
+    if output is None:
+        sys.stdout.write(text)
+    else:
+        with open(output, 'w') as out_file:
+            out_file.write(text)
+
+
+def _find_templates(env, name):
+    """
+    Find a template and all templates it includes, imports or extends. Templates whose name is only known when
+    rendering (e.g. given by a variable) are not found.
+    :return: List of tuples of the name, source and file name of every template
+    """
+    templates = []
+    seen = set()
+    names = [name]
+    while names:
+        name = names.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        source, filename, _ = env.loader.get_source(env, name)
+        templates.append((name, source, filename))
+        names += sorted(reference for reference in meta.find_referenced_templates(env.parse(source))
+                        if reference is not None)
+    return templates
+
+
+def get_template_digest(env, name):
+    """
+    Get a short hash of a template and of all templates it includes, imports or extends. Templates whose name is only
+    known when rendering (e.g. given by a variable) are not found.
+    :param env: The jinja2 Environment
+    :param name: The name of the template
+    :return: The hex digest
+    """
+    return get_digest('\0'.join(source for name, source, filename in _find_templates(env, name)))
+
+
+def get_digest(text):
+    """
+    Get a short hash of a text, e.g. a rendered input file
+    :param text: The text (str or bytes)
+    :return: The hex digest
+    """
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()[:20]
+
+
+def _write_inputfiles(template, config, context, tasks, pack=False, timed=False, writer=None):
+    """
+    Render the input files of a chunk of tasks and write them to disk (or hand them to a FileWriter). Input files with
+    the same digest as before are not written again. If they go into a pack file, they are returned instead, as the
+    pack file is written sequentially by a single process. If timed, the durations of rendering and writing every
+    input file are returned as well, the writer measures the durations of the files it writes itself.
+    """
+    results = []
+    render_times = []
+    write_times = []
+    for iterator, previous in tasks:
+        if timed:
+            start = time.perf_counter()
+        output = template.render(context.get(iterator))
+        if timed:
+            rendered = time.perf_counter()
+            render_times.append(rendered - start)
+        if pack:
+            results.append((iterator, output))
+        else:
+            digest = get_digest(output)
+            fname = get_input_filename(config, iterator)
+            written = digest != previous or not os.path.exists(fname)
+            if written and writer is not None:
+                writer.write(fname, output, timed=timed)
+            else:
+                if written:
+                    with open(fname, 'w') as out_file:
+                        out_file.write(output)
+                if timed:
+                    write_times.append(time.perf_counter() - rendered)
+            results.append((iterator, digest, written))
+    return results, (render_times, write_times) if timed else None
+
+
+def _init_worker(config, cores_local, pack, timed, staging):
+    _worker['template'] = get_environment().get_template(config['inputfile'])
+    _worker['config'] = config
+    _worker['context'] = RenderContext(config, cores_local)
+    _worker['pack'] = pack
+    _worker['timed'] = timed
+    _worker['writer'] = FileWriter(staging, remove=False) if staging is not None else None
+
+
+def _write_chunk(tasks):
+    result = _write_inputfiles(_worker['template'], _worker['config'], _worker['context'], tasks, _worker['pack'],
+                               _worker['timed'], _worker['writer'])
+    if _worker['writer'] is not None:
+        # the input files of the chunk are published before the chunk is reported as done
+        _worker['writer'].flush()
+        if _worker['timed']:
+            result[1][1].extend(_worker['writer'].take_times())
+    return result, get_read_files()
+
+
+def generate_inputfiles(template, config, cores_local, iterators, workers=1, pack=None, digests=None,
+                        profiler=None, writer=None, files=None):
+    """
+    Render and write the input files of the given tasks. With more than one worker, the tasks are split into chunks
+    which are rendered and written in separate processes. Every task draws its random numbers from its own stream, so
+    the input files do not depend on the number of workers.
+    :param template: The compiled template of the input files (used if workers is 1)
+    :param config: The cluster configuration
+    :param cores_local: Number of local CPUs made available as variable.
+    :param iterators: The iterators of the tasks to write
+    :param workers: Number of worker processes
+    :param pack: A PackWriter to write all input files to (if None, then every input file is written to its own file)
+    :param digests: Digests of the existing input files by iterator, unchanged input files are not written again
+    :param profiler: A Profiler to record the time of rendering and writing every input file, if it is enabled
+    :param writer: A FileWriter to write the input files in the background, worker processes use their own writers
+    with the same staging directory. All input files are published when the function returns.
+    :param files: Dict to which the modification time and size of every file read by the readtxt and filesize filters
+    are added (if None, then the files are not tracked)
+    :return: The digests of the rendered input files by iterator and the list of iterators whose input file changed
+    """
+    def store(chunk):
+        results, timings = chunk
+        if timings is not None:
+            profiler.add('render', timings[0])
+            profiler.add('write', timings[1])
+            if writer is not None:
+                # the files published by the writer threads so far
+                profiler.add('write', writer.take_times())
+        if pack is not None:
+            for iterator, output in results:
+                if timed:
+                    start = time.perf_counter()
+                pack.add(iterator, output)
+                if timed:
+                    profiler.add('write', [time.perf_counter() - start])
+                changed.append(iterator)
+        else:
+            for iterator, digest, written in results:
+                rendered[iterator] = digest
+                if written:
+                    changed.append(iterator)
+        progress.update(len(results))
+
+    if digests is None:
+        digests = {}
+    timed = profiler is not None and profiler.enabled
+    tasks = [(iterator, digests.get(iterator)) for iterator in iterators]
+    rendered = {}
+    changed = []
+    progress = Progress(len(tasks), 'input files')
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        context = RenderContext(config, cores_local)
+        chunksize = max(1, min(1000, len(tasks) // 100))
+        for i in range(0, len(tasks), chunksize):
+            store(_write_inputfiles(template, config, context, tasks[i:i + chunksize], pack is not None, timed,
+                                    writer))
+        if writer is not None:
+            writer.flush()
+            if timed:
+                profiler.add('write', writer.take_times())
+        if files is not None:
+            files.update(get_read_files())
+    else:
+        # imported here, as rendering a single input file (e.g. inside a job) does not need multiprocessing
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        # several chunks per worker to balance the load, but not too small to keep the overhead low
+        chunksize = max(1, min(1000, int(math.ceil(len(tasks) / (workers * 8)))))
+        chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+        # the threads of the writer may hold locks while a worker is forked, which could deadlock it, so the workers
+        # are forked from a server process which imported this module already
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['pycluster.generate'])
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(config, cores_local, pack is not None, timed,
+                                           writer.staging if writer is not None else None)) as executor:
+            futures = [executor.submit(_write_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                chunk, read_files = future.result()
+                if files is not None:
+                    files.update(read_files)
+                store(chunk)
+    if len(tasks) > 0:
+        progress.finish()
+    changed.sort()
+    return rendered, changed
+
+
+class Progress:
+    def __init__(self, total, name, interval=0.5):
+        """
+        Prints the progress and throughput of a loop to stdout.
+        :param total: Total number of items
+        :param name: Name of the items (e.g. 'input files')
+        :param interval: Minimum number of seconds between two updates
+        """
+        self.total = total
+        self.name = name
+        self.interval = interval
+        self.done = 0
+        self.start = time.perf_counter()
+        self._last_print = 0.
+
+    def update(self, num=1):
+        self.done += num
+        now = time.perf_counter()
+        if now - self._last_print >= self.interval:
+            self._last_print = now
+            elapsed = now - self.start
+            rate = self.done / elapsed if elapsed > 0 else 0.
+            sys.stdout.write('\r   {:d}/{:d} {} ({:.0f} per second)'.format(self.done, self.total, self.name, rate))
+            sys.stdout.flush()
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.
+        sys.stdout.write('\r   {:d}/{:d} {} done in {:.2f}s ({:.0f} per second)\n'.format(
+            self.done, self.total, self.name, elapsed, rate))
+        sys.stdout.flush()
@@ -0,0 +1,45 @@
+import subprocess
+from pycluster.userinput import *
+from pycluster.config import *
+
+__all__ = [
+    'InteractiveCluster'
+]
+
+
+class InteractiveCluster:
+    def __init__(self, partition=None, dry=False):
+        """
+        The constructor of the cluster class takes care of all preparation necessary before connecting in an
+        interactive session to the cluster, in particular interactively asking all parameters.
+        :param partition: The partition to connect to.
+        :param dry: Dry run: just output the correct bash command.
+        """
+        self.settings = parse_settings()
+        self.partition = partition if partition is not None else self.settings['partitions'][-1]['name']
+        assert not self.partition == 'local'
+        self.dry = dry
+
+        # determine slurm configuration in advance
+        self.partition_idx = get_partition_idx(self.settings, self.partition)
+        self.slurmconf = self.settings['partitions'][self.partition_idx]['slurmconf']
+        if 'job_init_command' in self.settings and self.settings['job_init_command']:
+            self.job_init_command = self.settings['job_init_command'] + '; '
+        else:
+            self.job_init_command = ''
+
+        # get parameters interactively
+        self.mem = variableinput('Memory', default='1024M')
+        self.mincpus = typedvariableinput('Minimum CPUs', 1, int)
+        self.workstation = variableinput('Workstation', default='any')
+        self.jobname = 'Interactive session (PyCluster)'
+
+    def run(self):
+        command = '{}export SLURM_CONF={};' \
+                  'srun -n 1 --pty --x11 --job-name "{}" -p "{}" --mem "{}" --mincpus "{:d}"'.format(
+            self.job_init_command, self.slurmconf, self.jobname, self.partition, self.mem, self.mincpus
+        )
+        if self.workstation != 'any':
+            command += ' -w {}'.format(self.workstation)
+        command += ' bash'
+        subprocess.run(command, shell=True, executable='/bin/bash')
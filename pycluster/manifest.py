@@ -0,0 +1,76 @@
+import os
+import json
+
+__all__ = [
+    'Manifest'
+]
+
+
+class Manifest:
+    def __init__(self, filename):
+        """
+        The manifest of a cluster run stores the digests of everything the input files were created from (templates
+        and configuration), the modification time and size of the files read by the templates and the digest of every
+        input file. It allows to write only those input files again which changed since the last run.
+        :param filename: The file name of the manifest
+        """
+        self.filename = filename
+        self.sources = {}
+        self.tasks = {}
+        self.files = {}
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as f:
+                    data = json.load(f)
+                self.sources = data['sources']
+                self.tasks = {int(iterator): digest for iterator, digest in data['tasks'].items()}
+                self.files = {fname: tuple(stat) for fname, stat in data.get('files', {}).items()}
+            except (ValueError, KeyError):
+                print('The manifest {} is damaged and will be ignored.'.format(filename))
+
+    def is_current(self, sources):
+        """
+        Check if the input files were created from the same sources and the files read by the templates did not
+        change.
+        :param sources: Dict of the digests of the sources
+        :return: True if all sources are unchanged
+        """
+        return len(self.sources) > 0 and self.sources == sources and not self._files_changed()
+
+    def _files_changed(self):
+        for fname, stat in self.files.items():
+            try:
+                current = os.stat(fname)
+            except OSError:
+                return True
+            if (current.st_mtime_ns, current.st_size) != stat:
+                return True
+        return False
+
+    def update(self, sources, digests, files=None):
+        """
+        Update the manifest after writing input files.
+        :param sources: Dict of the digests of the sources
+        :param digests: Digests of the written input files by iterator
+        :param files: Modification time and size of the files read by the templates by file name
+        """
+        if not self.is_current(sources):
+            # digests of input files that were not rendered again are unknown for the new sources
+            self.tasks = {}
+            self.files = {}
+        self.sources = sources
+        self.tasks.update(digests)
+        self.files.update(files or {})
+
+    def save(self):
+        """
+        Write the manifest to disk.
+        """
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'w') as out_file:
+            json.dump({
+                'sources': self.sources,
+                'tasks': {str(iterator): digest for iterator, digest in sorted(self.tasks.items())},
+                'files': {fname: list(stat) for fname, stat in sorted(self.files.items())}
+            }, out_file)
+        os.replace(tmpname, self.filename)
@@ -0,0 +1,170 @@
+import os
+import sys
+import mmap
+import struct
+from pycluster.config import *
+from pycluster.writer import publish_file
+
+__all__ = [
+    'PackWriter',
+    'read_packed',
+    'get_pack_filename',
+    'extract_inputfile'
+]
+
+# one index entry per input file: iterator, offset and length within the pack file
+_ENTRY = struct.Struct('<qQQ')
+# the pack file ends with the offset and the number of the index entries, followed by the magic
+_TRAILER = struct.Struct('<QQ')
+_MAGIC = b'PYCLPACK2\n'
+
+
+class PackWriter:
+    def __init__(self, filename, staging=None, merge=False):
+        """
+        Writes many input files sequentially into a single pack file. The offset and length of every input file is
+        stored in an index at the end of the pack file when the writer is closed. The pack is written to a temporary
+        file and replaces the previous one with a single rename only when the writer is closed without an error, so
+        that jobs reading the previous pack are not disturbed (they keep reading the file they opened, whose index
+        belongs to it) and an interrupted run leaves no partial pack behind.
+        :param filename: The file name of the pack file
+        :param staging: The directory to write the temporary file to, e.g. the staging directory of a FileWriter (if
+        None, then next to the pack file)
+        :param merge: Keep the input files of the previous pack which are not added again (e.g. if only some jobs are
+        rendered), otherwise the new pack holds only the added input files
+        """
+        self.filename = filename
+        self.merge = merge
+        self.staging = staging if staging is not None else os.path.dirname(filename)
+        self.tmpname = os.path.join(self.staging, '{}.{:d}.tmp'.format(os.path.basename(filename), os.getpid()))
+        self.file = open(self.tmpname, 'wb')
+        self.offset = 0
+        self.entries = []
+
+    def add(self, iterator, data):
+        """
+        Append an input file to the pack.
+        :param iterator: The iterator of the input file
+        :param data: The content of the input file (str or bytes)
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.file.write(data)
+        self.entries.append((iterator, self.offset, len(data)))
+        self.offset += len(data)
+
+    def close(self):
+        """
+        Append the index sorted by iterator to the pack file and replace the previous pack.
+        """
+        try:
+            if self.merge:
+                self._add_previous()
+            self.entries.sort()
+            for entry in self.entries:
+                self.file.write(_ENTRY.pack(*entry))
+            self.file.write(_TRAILER.pack(self.offset, len(self.entries)))
+            self.file.write(_MAGIC)
+            self.file.close()
+            publish_file(self.tmpname, self.filename)
+        except BaseException:
+            self.abort()
+            raise
+        # the index file of packs written by earlier versions
+        if os.path.exists(self.filename + '.idx'):
+            os.remove(self.filename + '.idx')
+
+    def _add_previous(self):
+        """
+        Copy the input files of the previous pack which were not added again.
+        """
+        try:
+            pack_file = open(self.filename, 'rb')
+        except FileNotFoundError:
+            return
+        added = set(iterator for iterator, offset, length in self.entries)
+        with pack_file, mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ) as pack:
+            index_offset, count = _read_trailer(pack, self.filename)
+            for iterator, offset, length in _ENTRY.iter_unpack(pack[index_offset:index_offset + count * _ENTRY.size]):
+                if iterator not in added:
+                    self.add(iterator, pack[offset:offset + length])
+
+    def abort(self):
+        """
+        Close and remove the temporary pack file, the previous pack is kept.
+        """
+        self.file.close()
+        if os.path.exists(self.tmpname):
+            os.remove(self.tmpname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _read_trailer(pack, filename):
+    """
+    Read the offset and the number of the index entries from the end of a mapped pack file.
+    """
+    if len(pack) < _TRAILER.size + len(_MAGIC) or pack[-len(_MAGIC):] != _MAGIC:
+        raise ValueError('The file {} is not a pack file.'.format(filename))
+    return _TRAILER.unpack_from(pack, len(pack) - len(_MAGIC) - _TRAILER.size)
+
+
+def read_packed(filename, iterator):
+    """
+    Read a single input file from a pack file. Only the index and the requested slice of the pack are read, both from
+    the same open file, so that a pack replaced in the meantime is never mixed with the previous one.
+    :param filename: The file name of the pack file
+    :param iterator: The iterator of the input file
+    :return: The content of the input file as bytes
+    :raises: KeyError if the iterator is not part of the pack
+    """
+    with open(filename, 'rb') as pack_file:
+        with mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ) as pack:
+            index_offset, count = _read_trailer(pack, filename)
+            # binary search within the sorted index
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                key, offset, length = _ENTRY.unpack_from(pack, index_offset + mid * _ENTRY.size)
+                if key == iterator:
+                    return pack[offset:offset + length]
+                elif key < iterator:
+                    lo = mid + 1
+                else:
+                    hi = mid
+    raise KeyError('The input file {:d} is not part of {}.'.format(iterator, filename))
+
+
+def get_pack_filename(config):
+    """
+    Get the file name of the pack file holding all input files
+    :param config: The cluster configuration
+    :return: The file name
+    """
+    return get_project_path(config, 'inputfiles', config['project_name'] + '.pack')
+
+
+def extract_inputfile(config, iterator, output=None):
+    """
+    Extract the input file of a single task from the pack file of a cluster run.
+    :param config: The cluster configuration stored with the run
+    :param iterator: The iterator of the task
+    :param output: The file name to write to (if None, then the input file is written to stdout)
+    """
+    try:
+        data = read_packed(get_pack_filename(config), iterator)
+    except KeyError:
+        print('The input file of job {:d} is not part of the pack file {}.'.format(iterator, get_pack_filename(config)))
+        sys.exit(1)
+    if output is None:
+        sys.stdout.buffer.write(data)
+    else:
+        with open(output, 'wb') as out_file:
+            out_file.write(data)
@@ -0,0 +1,109 @@
+import re
+import sys
+from pycluster.config import *
+from pycluster.slurm import *
+
+__all__ = [
+    'DEPENDENCIES',
+    'get_stage_configs',
+    'get_upstream_iterators'
+]
+
+# afterok: every job of the stage waits for all jobs of the preceding stage, aftercorr: array task n of the stage
+# waits only for array task n of the preceding stage
+DEPENDENCIES = ['afterok', 'aftercorr']
+
+# keys of the run that belong to its first stage only
+_FIRST_STAGE_KEYS = ['stages', 'sweep', 'collect', 'jobs', 'expected_outputs', 'output_subdirectories']
+
+
+def _error(message):
+    print('Invalid stage in the configuration: {}'.format(message))
+    sys.exit(1)
+
+
+def _get_upstream(config):
+    """
+    Get what a stage needs to know about the stage it depends on.
+    """
+    return {
+        'project_name': config['project_name'],
+        'directory': get_project_path(config),
+        'array': dict(config['array']),
+        'bundle': config['cluster'].get('bundle', 1)
+    }
+
+
+def get_stage_configs(config):
+    """
+    Get the configurations of the later stages of a pipeline, defined by the stages section of the configuration.
+    Every stage is a run of its own in the folder stages/<project_name>-<stage> of the project, with its own template,
+    executable and resources. It depends on the preceding stage (the run itself for the first stage). Its templates
+    get the variable stage with its name, its dependency and the project_name, directory, array and bundle of the
+    preceding stage (upstream). The jobs of an aftercorr stage also get upstream_iterators, the iterators of the jobs
+    of the preceding stage they wait for.
+    :param config: The cluster configuration of the run, with partition and bundle resolved
+    :return: List of the cluster configurations of the stages
+    """
+    stages = config.get('stages', [])
+    if not isinstance(stages, list):
+        _error('The stages must be a list.')
+    names = []
+    configs = []
+    upstream = config
+    for stage in stages:
+        if not isinstance(stage, dict) or 'name' not in stage or 'inputfile' not in stage:
+            _error('Every stage needs a name and an inputfile.')
+        name = stage['name']
+        if not re.match(r'^[A-Za-z0-9_.-]+$', str(name)) or name in names:
+            _error('The stage name {} is used twice or contains characters other than letters, digits, ".", "_" and '
+                   '"-".'.format(name))
+        names.append(name)
+        dependency = stage.get('dependency', 'afterok')
+        if dependency not in DEPENDENCIES:
+            _error('The dependency {} of the stage {} is not known. Please use {}.'.format(
+                dependency, name, ' or '.join(DEPENDENCIES)))
+
+        stage_config = {key: value for key, value in config.items() if key not in _FIRST_STAGE_KEYS}
+        stage_config.update({key: value for key, value in stage.items()
+                             if key not in ['name', 'dependency', 'cluster']})
+        # bundling and throttling are set per stage, all stages run on the partition of the run
+        stage_config['cluster'] = {key: value for key, value in config['cluster'].items()
+                                   if key not in ['bundle', 'throttle']}
+        stage_config['cluster'].update(stage.get('cluster', {}))
+        stage_config['cluster']['partition'] = config['cluster']['partition']
+        stage_config['cluster'].setdefault('bundle', 1)
+        stage_config['project_name'] = '{}-{}'.format(config['project_name'], name)
+        stage_config['output_directory'] = get_project_path(config, 'stages')
+        stage_config['stage'] = {'name': name, 'dependency': dependency, 'upstream': _get_upstream(upstream)}
+
+        if dependency == 'aftercorr':
+            # the array tasks of the stage correspond to the array tasks of the preceding stage
+            if 'array' in stage or stage_config['cluster']['bundle'] > 1:
+                _error('The array of the aftercorr stage {} is given by the array tasks of the preceding stage, it '
+                       'cannot have an array or a bundle of its own.'.format(name))
+            array = upstream['array']
+            bundle = upstream['cluster'].get('bundle', 1)
+            if bundle > 1:
+                stage_config['array'] = {'first': 0, 'step': 1,
+                                         'last': ((array['last'] - array['first']) // array['step']) // bundle}
+            else:
+                stage_config['array'] = dict(array)
+        else:
+            stage_config['array'] = stage.get('array', {'first': 0, 'step': 1, 'last': 0})
+        configs.append(stage_config)
+        upstream = stage_config
+    return configs
+
+
+def get_upstream_iterators(stage, index):
+    """
+    Get the iterators of the jobs of the preceding stage that an array task of an aftercorr stage waits for.
+    :param stage: The stage variable of the configuration of the stage
+    :param index: The array task of the stage (its iterator)
+    :return: The list of iterators
+    """
+    upstream = stage['upstream']
+    if upstream['bundle'] > 1:
+        return get_bundle_iterators(upstream, index, upstream['bundle'])
+    return [index]
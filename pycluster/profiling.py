@@ -0,0 +1,126 @@
+import sys
+import json
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+__all__ = [
+    'Profiler',
+    'Histogram'
+]
+
+# upper edges of the histogram bins in seconds
+_EDGES = [1e-6, 3e-6, 1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1, 3e-1, 1., 3., 10.]
+
+
+def _format_seconds(seconds):
+    if seconds < 1e-3:
+        return '{:.0f}us'.format(seconds * 1e6)
+    elif seconds < 1.:
+        return '{:.0f}ms'.format(seconds * 1e3)
+    return '{:.0f}s'.format(seconds)
+
+
+class Histogram:
+    def __init__(self):
+        """
+        Histogram of durations with logarithmic bins, which needs constant memory for any number of samples.
+        """
+        self.counts = [0] * (len(_EDGES) + 1)
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.counts[bisect_left(_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def extend(self, samples):
+        for seconds in samples:
+            self.add(seconds)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'bins': [
+                {'le': edge, 'count': count} for edge, count in zip(_EDGES + [None], self.counts)
+            ]
+        }
+
+    def print(self, name, width=40):
+        if self.count == 0:
+            return
+        print('   {} time per task: mean {}, min {}, max {}'.format(
+            name, _format_seconds(self.total / self.count), _format_seconds(self.min), _format_seconds(self.max)))
+        first = next(i for i, count in enumerate(self.counts) if count > 0)
+        last = max(i for i, count in enumerate(self.counts) if count > 0)
+        for i in range(first, last + 1):
+            label = '<= ' + _format_seconds(_EDGES[i]) if i < len(_EDGES) else ' > ' + _format_seconds(_EDGES[-1])
+            bar = '#' * int(round(width * self.counts[i] / max(self.counts)))
+            print('   {:>8} {:<{width}} {:d}'.format(label, bar, self.counts[i], width=width))
+
+
+class Profiler:
+    def __init__(self, enabled=False):
+        """
+        Measures the time spent in the phases of a cluster run and, if enabled, the time to render and write every
+        input file.
+        :param enabled: Measure the time of every input file
+        """
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.phases = OrderedDict()
+        self.histograms = OrderedDict([('render', Histogram()), ('write', Histogram())])
+        self.info = {}
+
+    def mark(self, phase):
+        """
+        Ends a phase: the time since the end of the previous phase is added to this phase.
+        :param phase: The name of the phase
+        """
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.) + now - self._last
+        self._last = now
+
+    def add(self, name, samples):
+        """
+        Adds the durations of some tasks.
+        :param name: 'render' or 'write'
+        :param samples: The durations in seconds
+        """
+        self.histograms[name].extend(samples)
+
+    def to_dict(self):
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'info': self.info,
+            'total': self._last - self.start,
+            'phases': self.phases,
+            'tasks': {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+        }
+
+    def report(self, filename=None):
+        """
+        Prints a summary of the time spent in every phase and writes the full report.
+        :param filename: The file to write the report to as JSON (if None, then no report is written)
+        """
+        total = self._last - self.start
+        print('Profile of the run ({:.3f}s in total):'.format(total))
+        for phase, seconds in self.phases.items():
+            print('   {:<20} {:>9.3f}s {:>5.1f}%'.format(phase, seconds, 100. * seconds / total if total > 0 else 0.))
+        for name, histogram in self.histograms.items():
+            histogram.print(name)
+        if filename is not None:
+            with open(filename, 'w') as out_file:
+                json.dump(self.to_dict(), out_file, indent=4)
+            print('The profile was written to {}.'.format(filename))
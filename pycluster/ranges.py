@@ -0,0 +1,186 @@
+import re
+from bisect import bisect_right
+
+__all__ = [
+    'RangeSet',
+    'compress_range',
+    'expand_range'
+]
+
+# one part of a slurm range expression: an index, or first-last with an optional step
+_PART = re.compile(r'^(\d+)(?:-(\d+)(?::(\d+))?)?$')
+
+
+def _format_part(first, last, step):
+    """
+    Format an arithmetic progression of indices as the shortest part of a range expression.
+    """
+    if first == last:
+        return '{:d}'.format(first)
+    if first + step == last:
+        # two indices are never longer as a list than as a range
+        return '{:d},{:d}'.format(first, last)
+    if step == 1:
+        return '{:d}-{:d}'.format(first, last)
+    return '{:d}-{:d}:{:d}'.format(first, last, step)
+
+
+def _split(indices):
+    """
+    Split sorted unique indices into arithmetic progressions of consecutive indices, so that the range expression is
+    as short as possible.
+    :return: List of tuples of first, last and step of every progression
+    """
+    n = len(indices)
+    if n == 0:
+        return []
+    # end[i]: the last index of the longest progression starting at index i
+    end = [n - 1] * n
+    for i in range(n - 3, -1, -1):
+        if indices[i + 2] - indices[i + 1] == indices[i + 1] - indices[i]:
+            end[i] = end[i + 1]
+        else:
+            end[i] = i + 1
+    # length of the shortest expression of the indices from i on, and where its first progression ends. A progression
+    # either extends as far as possible or stops one index earlier, so that its last index may start the next one.
+    # Stopping even earlier never helps, as the rest of the progression would continue with the same step.
+    length = [0] * (n + 1)
+    choice = [0] * n
+    for i in range(n - 1, -1, -1):
+        best = None
+        for j in {end[i], max(i, end[i] - 1)}:
+            step = indices[i + 1] - indices[i] if j > i else 1
+            candidate = len(_format_part(indices[i], indices[j], step)) + (1 + length[j + 1] if j + 1 < n else 0)
+            if best is None or candidate < best:
+                best = candidate
+                choice[i] = j
+        length[i] = best
+    parts = []
+    i = 0
+    while i < n:
+        j = choice[i]
+        parts.append((indices[i], indices[j], indices[i + 1] - indices[i] if j > i else 1))
+        i = j + 1
+    return parts
+
+
+class RangeSet:
+    def __init__(self, indices=()):
+        """
+        A set of job indices, stored as arithmetic progressions like in the range expressions of slurm (e.g.
+        4,8,20,24-48:4), so that also large arrays take little memory. The progressions are chosen such that the range
+        expression of the set is as short as possible.
+        :param indices: The indices (any iterable of non-negative integers, e.g. a range)
+        """
+        if isinstance(indices, range) and indices.step > 0:
+            # an array is a single progression
+            self._parts = [(indices[0], indices[-1], indices.step if len(indices) > 1 else 1)] if indices else []
+        else:
+            self._parts = _split(sorted(set(indices)))
+        self._firsts = [first for first, last, step in self._parts]
+        self._length = sum((last - first) // step + 1 for first, last, step in self._parts)
+
+    @classmethod
+    def parse(cls, expression):
+        """
+        Parse a slurm range expression, e.g. '4,8,20,24-48:4'.
+        :param expression: The range expression
+        :return: The RangeSet
+        :raises: ValueError if the expression is invalid
+        """
+        ranges = []
+        for part in str(expression).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            match = _PART.match(part)
+            if match is None:
+                raise ValueError('The range expression <{}> is invalid: <{}> is neither an index nor a range '
+                                 'first-last[:step].'.format(expression, part))
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) is not None else first
+            step = int(match.group(3)) if match.group(3) is not None else 1
+            if last < first or step < 1:
+                raise ValueError('The range expression <{}> is invalid: the range <{}> is empty.'.format(
+                    expression, part))
+            ranges.append(range(first, last + 1, step))
+        if len(ranges) == 1:
+            return cls(ranges[0])
+        return cls(index for indices in ranges for index in indices)
+
+    def __contains__(self, index):
+        i = bisect_right(self._firsts, index) - 1
+        if i < 0:
+            return False
+        first, last, step = self._parts[i]
+        return index <= last and (index - first) % step == 0
+
+    def _covers(self, first, last, step):
+        """
+        Check if a progression is part of a single progression of the set.
+        """
+        i = bisect_right(self._firsts, first) - 1
+        if i < 0:
+            return False
+        own_first, own_last, own_step = self._parts[i]
+        return (first - own_first) % own_step == 0 and last <= own_last and (first == last or step % own_step == 0)
+
+    def __iter__(self):
+        for first, last, step in self._parts:
+            yield from range(first, last + 1, step)
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def __eq__(self, other):
+        return isinstance(other, RangeSet) and self._parts == other._parts
+
+    def __and__(self, other):
+        """
+        Intersection, e.g. of the selected jobs with the array.
+        """
+        if not isinstance(other, RangeSet):
+            other = RangeSet(other)
+        smaller, larger = (self, other) if len(self) <= len(other) else (other, self)
+        if all(larger._covers(*part) for part in smaller._parts):
+            # e.g. the selected jobs are all part of the array
+            return smaller
+        return RangeSet(index for index in smaller if index in larger)
+
+    def __sub__(self, other):
+        """
+        Difference, e.g. the selected jobs that are not part of the array.
+        """
+        if not isinstance(other, RangeSet):
+            other = RangeSet(other)
+        return RangeSet(index for index in self if index not in other)
+
+    def __str__(self):
+        """
+        The shortest range expression of the set ('' if the set is empty).
+        """
+        return ','.join(_format_part(*part) for part in self._parts)
+
+    def __repr__(self):
+        return 'RangeSet({!r})'.format(str(self))
+
+
+def compress_range(indices):
+    """
+    Compress job indices into a slurm range expression, e.g. [0, 4, 8, 12, 20] becomes '0-12:4,20'.
+    :param indices: The job indices
+    :return: The range expression
+    """
+    return str(RangeSet(indices))
+
+
+def expand_range(expression):
+    """
+    Expand a slurm range expression into job indices, e.g. '0-12:4,20' becomes [0, 4, 8, 12, 20].
+    :param expression: The range expression
+    :return: The sorted job indices
+    """
+    return list(RangeSet.parse(expression))
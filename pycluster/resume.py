@@ -0,0 +1,123 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import Template
+from pycluster.config import *
+from pycluster.ranges import *
+from pycluster.slurm import *
+from pycluster.stats import read_accounting
+
+__all__ = [
+    'find_incomplete_jobs',
+    'FINISHED_MARKER'
+]
+
+# job.sh writes this to the end of the log file of every job
+FINISHED_MARKER = b'Finished job at'
+
+
+def _tail(fname, size=1024):
+    """
+    Read the end of a file without reading the whole file.
+    :return: The last bytes of the file or None if the file does not exist
+    """
+    try:
+        with open(fname, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - size))
+            return f.read()
+    except OSError:
+        return None
+
+
+def _check_jobs(config, iterators, outputs):
+    """
+    Check the log, err and output files of some jobs.
+    :return: List of tuples of iterator and the reason why the job is incomplete (None if complete)
+    """
+    results = []
+    for iterator in iterators:
+        reason = None
+        tail = _tail(get_log_filename(config, iterator, 'log'))
+        if tail is None:
+            reason = 'no log file'
+        elif FINISHED_MARKER not in tail:
+            reason = 'unfinished log'
+        else:
+            try:
+                if os.path.getsize(get_log_filename(config, iterator, 'err')) > 0:
+                    reason = 'error output'
+            except OSError:
+                pass
+        if reason is None:
+            for output in outputs:
+                fname = output.render(config, iterator=iterator)
+                if not os.path.exists(get_project_path(config, fname)):
+                    reason = 'missing output'
+                    break
+        results.append((iterator, reason))
+    return results
+
+
+def find_incomplete_jobs(config, settings, partition, iterators, workers=32):
+    """
+    Find the jobs of a cluster run that did not complete successfully. A job is complete if its log file ends with the
+    marker written by job.sh, its err file is empty and all files given by expected_outputs in the configuration
+    exist. Jobs that failed according to slurm (sacct) or the local executor are incomplete, jobs that are still
+    pending or running according to slurm are ignored. The slurm state of a bundle is that of all of its jobs, so a
+    bundled job is decided by its own files and its exit code in the accounting file instead. The files are checked in
+    parallel.
+    :param config: The cluster configuration
+    :param settings: A settings dict generated with parse_settings()
+    :param partition: The partition the jobs were submitted to
+    :param iterators: The iterators of all jobs
+    :param workers: Number of threads to check files with
+    :return: Dict of the reason by iterator of all incomplete jobs
+    """
+    iterators = list(iterators)
+    states = {}
+    bundled = set()
+    if partition != 'local':
+        states = get_sacct_states(config, settings, partition, bundled=bundled)
+        if states is None:
+            print('Warning: the job states could not be queried with sacct, only files are checked.')
+            states = {}
+    returncodes = {}
+    local_report = get_project_path(config, 'bash', config['project_name'] + '.local.json')
+    if partition == 'local' and os.path.isfile(local_report):
+        with open(local_report) as f:
+            returncodes = {int(iterator): result['returncode'] for iterator, result in json.load(f).items()}
+    if bundled:
+        returncodes = {iterator: record['status'] for iterator, record in read_accounting(config).items()
+                       if iterator in bundled}
+
+    # expected outputs are relative to the project directory and may contain placeholders, e.g. {{iterator}}
+    outputs = [Template(output) for output in config.get('expected_outputs', [])]
+
+    chunksize = max(1, min(1000, len(iterators) // (workers * 4) + 1))
+    chunks = [iterators[i:i + chunksize] for i in range(0, len(iterators), chunksize)]
+    incomplete = {}
+    active = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(lambda chunk: _check_jobs(config, chunk, outputs), chunks):
+            for iterator, reason in results:
+                state = states.get(iterator)
+                if state in ACTIVE_STATES:
+                    active.append(iterator)
+                elif state in FAILED_STATES and iterator not in bundled:
+                    incomplete[iterator] = 'slurm state {}'.format(state)
+                elif returncodes.get(iterator, 0) != 0:
+                    incomplete[iterator] = 'exit code {:d}'.format(returncodes[iterator])
+                elif reason is not None:
+                    incomplete[iterator] = reason
+
+    reasons = {}
+    for reason in incomplete.values():
+        reasons[reason] = reasons.get(reason, 0) + 1
+    print('{:d} of {:d} jobs are incomplete{}.'.format(
+        len(incomplete), len(iterators),
+        ''.join(', {:d} with {}'.format(count, reason) for reason, count in sorted(reasons.items()))
+    ))
+    if active:
+        print('{:d} jobs are still pending or running: <{}>.'.format(len(active), compress_range(active)))
+    return incomplete
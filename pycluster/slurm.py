@@ -0,0 +1,176 @@
+import os
+import shlex
+import subprocess
+from pycluster.config import *
+from pycluster.ranges import *
+
+__all__ = [
+    'run_slurm_command',
+    'get_jobs_filename',
+    'parse_jobs',
+    'get_bundle_iterators',
+    'get_sacct_states',
+    'get_squeue_states',
+    'FAILED_STATES',
+    'ACTIVE_STATES'
+]
+
+# slurm job states of array tasks that did not succeed and will not continue by themselves
+FAILED_STATES = ['BOOT_FAIL', 'CANCELLED', 'DEADLINE', 'FAILED', 'NODE_FAIL', 'OUT_OF_MEMORY', 'PREEMPTED', 'TIMEOUT']
+# slurm job states of array tasks that are waiting or running
+ACTIVE_STATES = ['PENDING', 'RUNNING', 'REQUEUED', 'RESIZING', 'SUSPENDED', 'CONFIGURING', 'COMPLETING']
+
+
+def run_slurm_command(settings, partition, name, arguments):
+    """
+    Run a slurm command (e.g. sacct) for a partition. The executable of each command can be replaced in the commands
+    section of settings.json, e.g. by a stand-in for testing.
+    :param settings: A settings dict generated with parse_settings()
+    :param partition: The partition whose slurm configuration is used
+    :param name: The name of the command
+    :param arguments: List of arguments
+    :return: The stdout of the command or None if the command failed
+    """
+    partition_settings = settings['partitions'][get_partition_idx(settings, partition)]
+    executable = settings.get('commands', {}).get(name, name)
+    command = '{}export SLURM_CONF={};{}'.format(
+        settings['job_init_command'] + '; ' if settings.get('job_init_command') else '',
+        partition_settings['slurmconf'],
+        ' '.join(shlex.quote(part) for part in [executable] + list(arguments))
+    )
+    result = subprocess.run(command, shell=True, executable='/bin/bash', stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, universal_newlines=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def get_jobs_filename(config):
+    """
+    Get the filename of the record of submitted job arrays
+    :param config: The cluster configuration
+    :return: The file name
+    """
+    return get_project_path(config, 'bash', config['project_name'] + '.jobs.json')
+
+
+def parse_jobs(config):
+    """
+    Read the record of submitted job arrays of a cluster run.
+    :param config: The cluster configuration
+    :return: List of submitted job arrays (empty if nothing was submitted)
+    """
+    fname = get_jobs_filename(config)
+    if not os.path.isfile(fname):
+        return []
+    return parse_config(fname, 'jobs')
+
+
+def get_bundle_iterators(config, bundle, size):
+    """
+    Get the iterators of the jobs that are run by one slurm array task.
+    :param config: The cluster configuration
+    :param bundle: The index of the bundle
+    :param size: The number of jobs per bundle
+    :return: The list of iterators
+    """
+    first, step, last = config['array']['first'], config['array']['step'], config['array']['last']
+    iterators = (first + position * step for position in range(bundle * size, (bundle + 1) * size))
+    return [iterator for iterator in iterators if iterator <= last]
+
+
+def _map_array_task(config, job, task):
+    # array tasks of submissions by array position are mapped back to job indices (or bundles)
+    index = job['offset'] + task * job.get('step', 1)
+    if job['bundle'] > 1:
+        iterators = get_bundle_iterators(config, index, job['bundle'])
+        if job.get('jobs') is not None:
+            # a bundle runs only the jobs selected when it was submitted
+            selection = RangeSet.parse(job['jobs'])
+            iterators = [iterator for iterator in iterators if iterator in selection]
+        return iterators
+    return [index]
+
+
+def _parse_states(config, jobs, output, bundled=None):
+    """
+    Parse the states of array tasks as listed by sacct or squeue (one 'jobid_task|state' per line).
+    :param bundled: Set, to which the iterators whose state is the state of their bundle are added (optional)
+    :return: Dict of the slurm state by iterator
+    """
+    tasks = {}
+    for line in output.splitlines():
+        if '|' not in line:
+            continue
+        jobid, state = line.split('|')[:2]
+        state = state.split(' ')[0]
+        if '_' not in jobid:
+            continue
+        jobid, task = jobid.split('_', 1)
+        if task.startswith('['):
+            # pending array tasks are reported as range expression, e.g. [5-10%2]
+            for index in expand_range(task.strip('[]').split('%')[0]):
+                tasks[(jobid, index)] = state
+        else:
+            tasks[(jobid, int(task))] = state
+
+    # later submissions overwrite the state of earlier ones
+    order = {job['jobid']: i for i, job in enumerate(jobs)}
+    # a combined array of a campaign runs the array tasks of other runs as well
+    arrays = {job['jobid']: set(expand_range(job['array'])) for job in jobs}
+    states = {}
+    for (jobid, task), state in sorted(tasks.items(), key=lambda item: (order.get(item[0][0], -1), item[0][1])):
+        if jobid in order and task in arrays[jobid]:
+            job = jobs[order[jobid]]
+            for iterator in _map_array_task(config, job, task):
+                states[iterator] = state
+                if bundled is not None:
+                    if job['bundle'] > 1:
+                        bundled.add(iterator)
+                    else:
+                        bundled.discard(iterator)
+    return states
+
+
+def get_sacct_states(config, settings, partition, jobs=None, bundled=None):
+    """
+    Query the states of all array tasks of a cluster run with a single call of sacct.
+    :param config: The cluster configuration
+    :param settings: A settings dict generated with parse_settings()
+    :param partition: The partition the jobs were submitted to
+    :param jobs: The submitted job arrays (if None, then they are read from disk)
+    :param bundled: Set, to which the iterators whose state is the state of their bundle are added (optional)
+    :return: Dict of the slurm state by iterator (None if sacct is not available)
+    """
+    if jobs is None:
+        jobs = parse_jobs(config)
+    if len(jobs) == 0:
+        return {}
+    output = run_slurm_command(settings, partition, 'sacct', [
+        '--noheader', '--parsable2', '--allocations', '--format=JobID,State',
+        '--jobs=' + ','.join(job['jobid'] for job in jobs)
+    ])
+    if output is None:
+        return None
+    return _parse_states(config, jobs, output, bundled)
+
+
+def get_squeue_states(config, settings, partition, jobs=None):
+    """
+    Query the states of all pending and running array tasks of a cluster run with a single call of squeue.
+    :param config: The cluster configuration
+    :param settings: A settings dict generated with parse_settings()
+    :param partition: The partition the jobs were submitted to
+    :param jobs: The submitted job arrays (if None, then they are read from disk)
+    :return: Dict of the slurm state by iterator (None if squeue is not available)
+    """
+    if jobs is None:
+        jobs = parse_jobs(config)
+    if len(jobs) == 0:
+        return {}
+    output = run_slurm_command(settings, partition, 'squeue', [
+        '--noheader', '--array', '--format=%i|%T', '--jobs=' + ','.join(job['jobid'] for job in jobs)
+    ])
+    if output is None:
+        return None
+    return _parse_states(config, jobs, output)
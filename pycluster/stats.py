@@ -0,0 +1,148 @@
+import json
+import math
+from pycluster.config import *
+
+__all__ = [
+    'get_accounting_filename',
+    'read_accounting',
+    'recommend_resources',
+    'print_stats'
+]
+
+# margin on top of the largest measured wall time and memory
+TIME_MARGIN = 1.5
+MEMORY_MARGIN = 1.2
+
+
+def get_accounting_filename(config):
+    """
+    Get the file name of the accounting file, to which job.sh appends the wall time and peak memory of every job
+    :param config: The cluster configuration
+    :return: The file name
+    """
+    return get_project_path(config, 'bash', config['project_name'] + '.accounting.tsv')
+
+
+def read_accounting(config):
+    """
+    Read the accounting file of a cluster run. If a job ran several times, its last run is used.
+    :param config: The cluster configuration
+    :return: Dict of iterator to dict of jobid, walltime (s), maxrss (kB, None if unknown), status and host
+    """
+    records = {}
+    try:
+        in_file = open(get_accounting_filename(config))
+    except FileNotFoundError:
+        return records
+    with in_file:
+        for line in in_file:
+            fields = line.rstrip('\n').split('\t')
+            try:
+                records[int(fields[0])] = {
+                    'jobid': fields[1],
+                    'walltime': float(fields[2]),
+                    'maxrss': int(fields[3]) if fields[3] not in ['', '-'] else None,
+                    'status': int(fields[4]),
+                    'host': fields[5]
+                }
+            except (IndexError, ValueError):
+                # lines of jobs writing at the same time may be garbled on network file systems
+                continue
+    return records
+
+
+def _percentile(values, percent):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    return values[max(0, int(math.ceil(percent / 100. * len(values))) - 1)]
+
+
+def _format_memory(megabytes):
+    if megabytes % 1024 == 0:
+        return '{:d}G'.format(megabytes // 1024)
+    return '{:d}M'.format(megabytes)
+
+
+def _format_time(seconds):
+    minutes = int(math.ceil(seconds / 60.))
+    return '{:d}-{:02d}:{:02d}:00'.format(minutes // 1440, minutes // 60 % 24, minutes % 60)
+
+
+def recommend_resources(config, records):
+    """
+    Recommend max_memory and max_time for the next submission of a cluster run from the largest measured wall time
+    and peak memory of its jobs, with a margin. max_memory is given per CPU and max_time per slurm array task, which
+    runs several jobs if they are bundled.
+    :param config: The cluster configuration
+    :param records: The accounting records as returned by read_accounting()
+    :return: Dict with the recommended max_memory and max_time (None if nothing was measured)
+    """
+    bundle = config['cluster'].get('bundle', 1)
+    cpus = config['cluster'].get('cpus_per_task', 1)
+    recommendation = {'max_memory': None, 'max_time': None}
+    walltimes = [record['walltime'] for record in records.values()]
+    if walltimes:
+        rounds = int(math.ceil(bundle / cpus)) if bundle > 1 else 1
+        recommendation['max_time'] = _format_time(max(60., max(walltimes) * rounds * TIME_MARGIN))
+    memory = [record['maxrss'] for record in records.values() if record['maxrss'] is not None]
+    if memory:
+        # bundled jobs run one per CPU, otherwise a job may use all CPUs of the array task
+        megabytes = max(memory) * MEMORY_MARGIN / 1024. / (1 if bundle > 1 else cpus)
+        # round up to multiples of 128M
+        recommendation['max_memory'] = _format_memory(int(math.ceil(megabytes / 128.)) * 128)
+    return recommendation
+
+
+def print_stats(config, iterators, config_filename=None):
+    """
+    Print percentiles of the wall time and peak memory of the jobs of a cluster run and recommend max_memory and
+    max_time for the next submission.
+    :param config: The cluster configuration
+    :param iterators: The iterators of all jobs
+    :param config_filename: Write the recommendation into this configuration file (if None, then nothing is written)
+    """
+    records = read_accounting(config)
+    iterators = list(iterators)
+    records = {iterator: records[iterator] for iterator in iterators if iterator in records}
+    if not records:
+        print('No job of {} recorded its resource usage in {} yet.'.format(config['project_name'],
+                                                                           get_accounting_filename(config)))
+        return
+
+    print('Resource usage of {:d} of {:d} jobs:'.format(len(records), len(iterators)))
+    print('   {:<20} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('', 'median', 'p90', 'p99', 'max', 'mean'))
+    walltimes = sorted(record['walltime'] for record in records.values())
+    print('   {:<20} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+        'wall time (s)', _percentile(walltimes, 50), _percentile(walltimes, 90), _percentile(walltimes, 99),
+        walltimes[-1], sum(walltimes) / len(walltimes)))
+    memory = sorted(record['maxrss'] / 1024. for record in records.values() if record['maxrss'] is not None)
+    if memory:
+        print('   {:<20} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f}'.format(
+            'peak memory (MB)', _percentile(memory, 50), _percentile(memory, 90), _percentile(memory, 99),
+            memory[-1], sum(memory) / len(memory)))
+    else:
+        print('   The peak memory was not measured (neither /usr/bin/time nor cgroup v2 are available).')
+
+    failed = [iterator for iterator, record in records.items() if record['status'] != 0]
+    if failed:
+        print('{:d} jobs exited with an error.'.format(len(failed)))
+    if len(records) < len(iterators):
+        print('{:d} jobs have no record: they did not run yet or were killed (e.g. for exceeding max_memory or '
+              'max_time).'.format(len(iterators) - len(records)))
+
+    recommendation = recommend_resources(config, records)
+    print('Recommended resources (current values in brackets):')
+    for key in ['max_memory', 'max_time']:
+        if recommendation[key] is not None:
+            print('   {:<12} {} ({})'.format(key, recommendation[key], config['cluster'][key]))
+
+    if config_filename is not None:
+        with open(config_filename) as in_file:
+            stored = json.load(in_file)
+        for key, value in recommendation.items():
+            if value is not None:
+                stored['cluster'][key] = value
+        with open(config_filename, 'w') as out_file:
+            json.dump(stored, out_file, indent=4, sort_keys=False)
+        print('The recommended resources were written to {}.'.format(config_filename))
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+from pycluster.config import *
+from pycluster.slurm import *
+
+__all__ = [
+    'get_job_states',
+    'print_status'
+]
+
+
+def _format_duration(seconds):
+    seconds = int(round(seconds))
+    return '{:d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def get_job_states(config, settings, partition, max_age=30.):
+    """
+    Get the slurm states of all jobs of a cluster run. All job arrays are queried with one call of squeue and one
+    call of sacct. The result is cached in bash/<project_name>.status.json, so that repeated queries (e.g. of several
+    users watching the same run) within max_age seconds do not query slurm again.
+    :param config: The cluster configuration
+    :param settings: A settings dict generated with parse_settings()
+    :param partition: The partition the jobs were submitted to
+    :param max_age: Maximum age of cached states in seconds
+    :return: Dict of the slurm state by iterator and the time of the query
+    """
+    cache = get_project_path(config, 'bash', config['project_name'] + '.status.json')
+    jobs = parse_jobs(config)
+    try:
+        with open(cache) as f:
+            data = json.load(f)
+        if time.time() - data['time'] <= max_age and data['jobids'] == [job['jobid'] for job in jobs]:
+            return {int(iterator): state for iterator, state in data['states'].items()}, data['time']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    states = get_sacct_states(config, settings, partition, jobs)
+    if states is None:
+        print('Warning: the job states could not be queried with sacct.')
+        states = {}
+    # squeue knows the current state of pending and running jobs
+    active = get_squeue_states(config, settings, partition, jobs)
+    if active is not None:
+        states.update(active)
+
+    now = time.time()
+    tmpname = '{}.{:d}.tmp'.format(cache, os.getpid())
+    with open(tmpname, 'w') as out_file:
+        json.dump({
+            'time': now,
+            'jobids': [job['jobid'] for job in jobs],
+            'states': {str(iterator): state for iterator, state in states.items()}
+        }, out_file)
+    os.replace(tmpname, cache)
+    return states, now
+
+
+def print_status(config, settings, partition, iterators, max_age=30.):
+    """
+    Print the number of jobs of a cluster run in each slurm state, the throughput and the estimated remaining time.
+    :param config: The cluster configuration
+    :param settings: A settings dict generated with parse_settings()
+    :param partition: The partition the jobs were submitted to
+    :param iterators: The iterators of all jobs
+    :param max_age: Maximum age of cached states in seconds
+    """
+    jobs = parse_jobs(config)
+    if len(jobs) == 0:
+        print('No jobs were submitted for this configuration.')
+        return
+    states, queried = get_job_states(config, settings, partition, max_age)
+
+    counts = {}
+    for iterator in iterators:
+        state = states.get(iterator, 'UNKNOWN')
+        counts[state] = counts.get(state, 0) + 1
+    print('Job arrays {} (status of {}):'.format(
+        ', '.join(job['jobid'] for job in jobs), time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(queried))))
+    for state, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print('   {:<14s} {:>8d}'.format(state, count))
+
+    # throughput since the first submission
+    started = min(time.mktime(time.strptime(job['submitted'], '%Y-%m-%dT%H:%M:%S')) for job in jobs)
+    done = counts.get('COMPLETED', 0)
+    remaining = sum(count for state, count in counts.items() if state in ACTIVE_STATES)
+    elapsed = queried - started
+    if done > 0 and elapsed > 0:
+        rate = done / elapsed
+        print('Throughput: {:.1f} jobs per hour, estimated remaining time {}.'.format(
+            rate * 3600., _format_duration(remaining / rate)))
+    else:
+        print('Throughput: no job completed yet.')
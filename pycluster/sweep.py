@@ -0,0 +1,132 @@
+import sys
+import json
+import math
+from pycluster.config import *
+
+__all__ = [
+    'Sweep',
+    'get_parameter_table_filename',
+    'write_parameter_table'
+]
+
+# variables set for every task, which cannot be used as names of sweep parameters
+RESERVED_NAMES = ['iterator', 'random_state', 'parameters', 'sweep_index', 'repetition']
+
+
+class Sweep:
+    def __init__(self, definition):
+        """
+        A parameter sweep over the cartesian product of several axes. The parameters of a point of the sweep are
+        computed from its index when needed, so the points are never listed in full, even if there are millions.
+        :param definition: The sweep section of the configuration. It maps the name of each axis to either a list of
+        values, a range {"first": 0, "last": 10, "step": 2} (including last) or a group of lists of the same length
+        {"zip": {"name1": [...], "name2": [...]}}, whose values change together. The last axis changes fastest.
+        """
+        self.axes = []
+        self.names = []
+        if not isinstance(definition, dict) or len(definition) == 0:
+            self._error('The sweep must map the name of each axis to its values.')
+        for name, axis in definition.items():
+            if isinstance(axis, list):
+                self._add_axis([name], [(value,) for value in axis])
+            elif isinstance(axis, dict) and 'zip' in axis:
+                group = axis['zip']
+                if not isinstance(group, dict) or len(group) == 0 or \
+                        not all(isinstance(values, list) for values in group.values()):
+                    self._error('The zipped axis {} must map each parameter name to a list of values.'.format(name))
+                if len(set(len(values) for values in group.values())) > 1:
+                    self._error('All lists of the zipped axis {} must have the same length.'.format(name))
+                self._add_axis(list(group.keys()), list(zip(*group.values())))
+            elif isinstance(axis, dict) and all(key in axis for key in ['first', 'last', 'step']):
+                first, last, step = axis['first'], axis['last'], axis['step']
+                if step == 0 or (last - first) / step < 0:
+                    self._error('The last value {} of the axis {} is not reachable with a step size of {} from the '
+                                'first value {}.'.format(last, name, step, first))
+                self._add_axis([name], _Range(first, last, step))
+            else:
+                self._error('The axis {} must be a list of values, a range with first, last and step or a group of '
+                            'lists to zip.'.format(name))
+        self.size = 1
+        for names, values in self.axes:
+            self.size *= len(values)
+
+    def _add_axis(self, names, values):
+        for name in names:
+            if name in RESERVED_NAMES or name in self.names:
+                self._error('The sweep parameter name {} is reserved or used twice.'.format(name))
+        if len(values) == 0:
+            self._error('The sweep axis of {} has no values.'.format(', '.join(names)))
+        self.names += names
+        self.axes.append((names, values))
+
+    @staticmethod
+    def _error(msg):
+        print('Invalid sweep in the configuration: ' + msg)
+        sys.exit(1)
+
+    def __len__(self):
+        return self.size
+
+    def get(self, index):
+        """
+        Get the parameters of a point of the sweep.
+        :param index: The index of the point (0 <= index < len(sweep))
+        :return: Dict of the parameter values by name
+        """
+        parameters = {}
+        for names, values in reversed(self.axes):
+            index, position = divmod(index, len(values))
+            parameters.update(zip(names, values[position]))
+        return {name: parameters[name] for name in self.names}
+
+
+class _Range:
+    """
+    The values of a range axis, computed on demand.
+    """
+    def __init__(self, first, last, step):
+        self.first = first
+        self.step = step
+        self.size = int(math.floor((last - first) / step + 1e-9)) + 1
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        value = self.first + position * self.step
+        if isinstance(value, float):
+            # avoid values like 0.30000000000000004 in the input files
+            value = round(value, 10)
+        return value,
+
+
+def get_parameter_table_filename(config):
+    """
+    Get the file name of the table of the sweep parameters of all jobs
+    :param config: The cluster configuration
+    :return: The file name
+    """
+    return get_project_path(config, 'bash', config['project_name'] + '.parameters.tsv')
+
+
+def write_parameter_table(context, iterators, filename):
+    """
+    Write the sweep parameters of the jobs to a tab separated table, one line per job, e.g. for the analysis of the
+    results.
+    :param context: The RenderContext of the run
+    :param iterators: The iterators of the jobs
+    :param filename: The file name of the table
+    """
+    def format_value(value):
+        if isinstance(value, str):
+            return value
+        return json.dumps(value)
+
+    with open(filename, 'w') as out_file:
+        out_file.write('\t'.join(['iterator', 'sweep_index', 'repetition'] + context.sweep.names) + '\n')
+        for iterator in iterators:
+            sweep_index, repetition, parameters = context.get_parameters(iterator)
+            out_file.write('\t'.join(
+                ['{:d}'.format(iterator), '{:d}'.format(sweep_index), '{:d}'.format(repetition)] +
+                [format_value(parameters[name]) for name in context.sweep.names]
+            ) + '\n')
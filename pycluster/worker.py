@@ -0,0 +1,221 @@
+"""
+Runs the python input files of a cluster run in persistent worker processes, which import the configured modules only
+once. It is started by job.sh for a bundle of jobs (--bundle) and by the local executor (--serve), with the executable
+of the run, so it depends on the standard library only.
+
+Usage:
+    worker.py <config> --bundle <index>
+    worker.py <config> --serve <processes>
+"""
+
+import os
+import sys
+import time
+import socket
+import builtins
+import importlib
+import resource
+import traceback
+import multiprocessing
+
+# the worker runs as a script with the python executable of the run
+_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+
+from pycluster.config import *  # noqa: E402
+from pycluster.ranges import *  # noqa: E402
+from pycluster.slurm import get_bundle_iterators  # noqa: E402
+from pycluster.pack import read_packed, get_pack_filename  # noqa: E402
+
+__all__ = [
+    'get_worker_filename',
+    'get_worker_options'
+]
+
+_worker = {}
+
+
+def get_worker_filename():
+    """
+    :return: The file name of this script, which job.sh and the local executor run with the executable of the run
+    """
+    return os.path.abspath(__file__)
+
+
+def get_worker_options(config):
+    """
+    Get the options of the python workers of a cluster run.
+    :param config: The cluster configuration
+    :return: Dict with the modules to import, the number of processes (None for one per CPU) and the number of jobs
+    after which a process is replaced by a new one (None to keep it)
+    """
+    options = {'imports': [], 'processes': None, 'max_tasks': None}
+    if isinstance(config.get('worker'), dict):
+        options.update(config['worker'])
+    return options
+
+
+def _init_worker(config, imports):
+    """
+    Import the modules once per process. The output of the process outside of jobs goes to stderr.
+    """
+    _worker['config'] = config
+    _worker['template'] = None
+    _worker['cwd'] = os.getcwd()
+    _worker['stderr'] = os.dup(2)
+    os.dup2(2, 1)
+    for name in imports:
+        importlib.import_module(name)
+
+
+def _get_source(iterator):
+    """
+    Get the input file of a job, as created in advance or rendered now.
+    """
+    config = _worker['config']
+    if config['input_mode'] == 'pack':
+        return read_packed(get_pack_filename(config), iterator).decode('utf-8')
+    elif config['input_mode'] == 'runtime':
+        from pycluster.generate import get_frozen_template
+        from pycluster.context import RenderContext
+        if _worker['template'] is None:
+            _worker['template'] = get_frozen_template(config)
+            _worker['context'] = RenderContext(config, config.get('cores_local'))
+        return _worker['template'].render(_worker['context'].get(iterator))
+    with open(get_input_filename(config, iterator)) as in_file:
+        return in_file.read()
+
+
+def _execute(iterator):
+    """
+    Run the input file of a job in a fresh namespace.
+    :return: The exit code
+    """
+    fname = get_input_filename(_worker['config'], iterator)
+    try:
+        code = compile(_get_source(iterator), fname, 'exec')
+        sys.argv = [fname]
+        exec(code, {'__name__': '__main__', '__file__': fname, '__builtins__': builtins})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def _run_job(iterator):
+    """
+    Run a single job with its stdout and stderr (also of C extensions) redirected to its log and err files, like
+    job.sh does.
+    :return: The iterator, the exit code and the wall time
+    """
+    config = _worker['config']
+    with open(get_log_filename(config, iterator, 'log'), 'w') as logfile, \
+            open(get_log_filename(config, iterator, 'err'), 'w') as errfile:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(logfile.fileno(), 1)
+        os.dup2(errfile.fileno(), 2)
+        try:
+            then = time.strftime('%Y-%m-%d %H:%M:%S')
+            print('Job number {:d}'.format(iterator))
+            print('Starting job at {}.'.format(then))
+            start = time.time()
+            status = _execute(iterator)
+            walltime = time.time() - start
+            print('Started job at {}.'.format(then))
+            print('Finished job at {}.'.format(time.strftime('%Y-%m-%d %H:%M:%S')))
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(_worker['stderr'], 1)
+            os.dup2(_worker['stderr'], 2)
+            os.chdir(_worker['cwd'])
+
+    # the peak memory is the one of the worker process, which ran this and all earlier jobs
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    line = '{:d}\t{}\t{:.2f}\t{:d}\t{:d}\t{}\n'.format(iterator, os.environ.get('SLURM_ARRAY_JOB_ID', 'local'),
+                                                       walltime, maxrss, status, socket.gethostname())
+    fd = os.open(get_project_path(config, 'bash', config['project_name'] + '.accounting.tsv'),
+                 os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
+    return iterator, status, round(walltime, 3)
+
+
+def _get_pool(config, processes):
+    options = get_worker_options(config)
+    # processes replacing finished ones are forked by the pool while its threads hold locks, which can deadlock them,
+    # so they are forked from a server process which imported the modules already
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(options['imports'])
+    return context.Pool(options['processes'] or processes, initializer=_init_worker,
+                        initargs=(config, options['imports']), maxtasksperchild=options['max_tasks'])
+
+
+def run_bundle(config, bundle):
+    """
+    Run the jobs of a bundle (a slurm array task), only those selected by PYCLUSTER_JOBS if given.
+    :param config: The cluster configuration stored with the run
+    :param bundle: The index of the bundle
+    :return: True if all jobs succeeded
+    """
+    iterators = get_bundle_iterators(config, bundle, config['cluster']['bundle'])
+    if os.environ.get('PYCLUSTER_JOBS'):
+        selected = RangeSet.parse(os.environ['PYCLUSTER_JOBS'])
+        iterators = [iterator for iterator in iterators if iterator in selected]
+    success = True
+    with _get_pool(config, config['cluster'].get('cpus_per_task', 1)) as pool:
+        for iterator, status, walltime in pool.imap_unordered(_run_job, iterators):
+            success = success and status == 0
+    return success
+
+
+def serve(config, processes):
+    """
+    Run the jobs whose iterators are read from stdin, one per line, until stdin is closed. For every finished job,
+    its iterator, exit code and wall time are written to stdout.
+    :param config: The cluster configuration stored with the run
+    :param processes: Number of processes, unless given by the worker options of the configuration
+    """
+    def report(result):
+        sys.stdout.write('{:d} {:d} {:.3f}\n'.format(*result))
+        sys.stdout.flush()
+
+    def failed(iterator):
+        # a job which raised in the worker (e.g. its log file could not be opened) is reported as failed, otherwise
+        # the executor would wait for it forever
+        def callback(error):
+            print('Job {:d} failed in the worker:'.format(iterator), file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__)
+            sys.stderr.flush()
+            report((iterator, 1, 0.))
+        return callback
+
+    with _get_pool(config, processes) as pool:
+        results = []
+        for line in sys.stdin:
+            if line.strip():
+                iterator = int(line)
+                results.append(pool.apply_async(_run_job, (iterator,), callback=report,
+                                                error_callback=failed(iterator)))
+        for result in results:
+            result.wait()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[2] not in ['--bundle', '--serve']:
+        print(__doc__.strip())
+        sys.exit(1)
+    run_config = parse_config(sys.argv[1], 'config')
+    if sys.argv[2] == '--serve':
+        serve(run_config, int(sys.argv[3]))
+    else:
+        sys.exit(0 if run_bundle(run_config, int(sys.argv[3])) else 1)
@@ -0,0 +1,162 @@
+import os
+import stat
+import time
+import errno
+import queue
+import shutil
+import tempfile
+import threading
+import itertools
+
+__all__ = [
+    'FileWriter',
+    'publish_file'
+]
+
+
+def publish_file(staged, fname):
+    """
+    Move a complete file to its destination, so that the destination is either the previous or the new file.
+    :param staged: The complete file, e.g. in a staging directory
+    :param fname: The destination. On another file system than the staged file, the file is copied next to the
+    destination and renamed there.
+    """
+    try:
+        os.replace(staged, fname)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # the staging directory is on another file system, copy next to the destination and rename there
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname), prefix='.' + os.path.basename(fname))
+        os.close(fd)
+        try:
+            shutil.copy2(staged, tmp)
+            os.replace(tmp, fname)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.remove(staged)
+
+
+class FileWriter:
+    def __init__(self, staging, threads=8, queue_size=256, remove=True):
+        """
+        Writes files in background threads. Every file is first written to a staging directory and then published
+        by renaming it to its destination, so that a file is either complete or not there at all, even if the run is
+        interrupted. The queue of files is bounded, so that rendering waits for the threads if they fall behind.
+        :param staging: The staging directory. On the file system of the destinations, files are published by a
+        rename, otherwise (e.g. on a local disk) they are copied next to their destination and renamed there.
+        :param threads: Number of threads writing files
+        :param queue_size: Maximum number of files waiting to be written
+        :param remove: Remove the staging directory when the writer is closed
+        """
+        self.staging = staging
+        self.remove = remove
+        self.errors = []
+        os.makedirs(staging, exist_ok=True)
+        # unique names of the staged files, also if several processes share the staging directory
+        self._pid = os.getpid()
+        self._counter = itertools.count()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._aborted = False
+        self._lock = threading.Lock()
+        self._times = []
+        self._threads = [threading.Thread(target=self._work, daemon=True) for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def write(self, fname, data, executable=False, timed=False):
+        """
+        Hand a file to the background threads.
+        :param fname: The destination
+        :param data: The content (str or bytes)
+        :param executable: Make the file executable
+        :param timed: Measure the time of writing the file to the staging directory and publishing it (see
+        take_times())
+        """
+        self._queue.put((fname, data, executable, timed))
+
+    def take_times(self):
+        """
+        Get the durations of writing and publishing the timed files published since the last call.
+        :return: List of durations in seconds
+        """
+        with self._lock:
+            times, self._times = self._times, []
+        return times
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if not self._aborted:
+                    self._write(*item)
+            except Exception as e:
+                # any error is raised again by flush(), also one that is not an OSError
+                self.errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, fname, data, executable, timed):
+        if timed:
+            start = time.perf_counter()
+        staged = os.path.join(self.staging, '{:d}-{:d}'.format(self._pid, next(self._counter)))
+        try:
+            with open(staged, 'xb' if isinstance(data, bytes) else 'x') as out_file:
+                out_file.write(data)
+            if executable:
+                os.chmod(staged, os.stat(staged).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+            publish_file(staged, fname)
+        except BaseException:
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+        if timed:
+            with self._lock:
+                self._times.append(time.perf_counter() - start)
+
+    def flush(self):
+        """
+        Wait until all files handed to the writer are published.
+        :raises: The first error of writing a file (e.g. OSError)
+        """
+        self._queue.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def close(self):
+        """
+        Publish all remaining files and stop the threads.
+        :raises: The first error of writing a file (e.g. OSError)
+        """
+        try:
+            self.flush()
+        finally:
+            self._stop()
+
+    def abort(self):
+        """
+        Stop the threads, files that are not published yet are discarded.
+        """
+        self._aborted = True
+        self._stop()
+
+    def _stop(self):
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self.remove:
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,10 @@
+#########################################################################################################
+# Sum the partial sums of all jobs of the reduce stage. This job starts when all of them finished.
+#########################################################################################################
+
+total=0
+for i in $(seq {{stage.upstream.array.first}} {{stage.upstream.array.step}} {{stage.upstream.array.last}}); do
+	total=$(( total + $(< "{{stage.upstream.directory}}/output/sum-${i}.txt") ))
+done
+echo "The sum of the powers {{power}} is ${total}."
+echo ${total} > "{{output_directory}}/{{project_name}}/total.txt"
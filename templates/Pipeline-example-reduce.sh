@@ -0,0 +1,12 @@
+#########################################################################################################
+# Sum the results of the jobs {{ upstream_iterators | first }} to {{ upstream_iterators | last }}, which ran in array
+# task {{iterator}} of the first stage. This job starts as soon as that array task finished.
+#########################################################################################################
+
+sum=0
+{% for i in upstream_iterators %}
+sum=$(( sum + $(< "{{stage.upstream.directory}}/output/power-{{i}}.txt") ))
+{% endfor %}
+outputdir="{{output_directory}}/{{project_name}}/output"
+mkdir -p "${outputdir}"
+echo ${sum} > "${outputdir}/sum-{{iterator}}.txt"
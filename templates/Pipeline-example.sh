@@ -0,0 +1,7 @@
+#########################################################################################################
+# Calculate the power {{power}} of the number {{iterator}} and write the result to disk.
+#########################################################################################################
+
+outputdir="{{output_directory}}/{{project_name}}/output"
+mkdir -p "${outputdir}"
+echo $(( {{iterator}}**{{power}} )) > "${outputdir}/power-{{iterator}}.txt"
@@ -10,8 +10,8 @@ print('We are calculating the power {:d} of {:d}.'.format(power, number))
 powerofnumber = number**power
 print('The power {:d} of {:d} is {:d}'.format(power, number, powerofnumber))
 
-# finally write the result to disk {{output_directory}} will be replaced by pycluster.py
-outputdir = '{{output_directory}}/{{project_name}}/output'
+# finally write the result to disk {{output_path}} will be replaced by pycluster.py
+outputdir = '{{output_path}}/output'
 os.makedirs(outputdir, exist_ok=True)
 fname = outputdir + '/output-{:d}.txt'.format(number)
 with open(fname, 'w') as file:
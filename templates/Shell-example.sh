@@ -9,8 +9,8 @@ echo "We are calculating the power ${power} of ${number}."
 powerofnumber=$((${number}**${power}))
 echo "The power ${power} of ${number} is ${powerofnumber}."
 
-# finally write the result to disk {{output_directory}} will be replaced by pycluster.py
-outputdir="{{output_directory}}/{{project_name}}/output"
+# finally write the result to disk {{output_path}} will be replaced by pycluster.py
+outputdir="{{output_path}}/output"
 mkdir -p ${outputdir}
 fname="${outputdir}/output-${number}.txt"
 echo "The power ${power} of ${number} is ${powerofnumber}." >> ${fname}
\ No newline at end of file
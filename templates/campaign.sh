@@ -0,0 +1,21 @@
+#!/bin/bash
+
+########################################################################
+# Cluster Settings (shared by all runs of the combined array)
+
+#SBATCH --job-name='{{name}} (PyCluster campaign)'
+#SBATCH --output=/dev/null
+#SBATCH --error=/dev/null
+{{sbatch | join('\n')}}
+
+# Every run of the campaign has its own range of array task ids, its job file gets the array task id shifted by an
+# offset, by which it finds its job and writes its log files itself
+{% for run in runs %}
+if [[ ${SLURM_ARRAY_TASK_ID} -ge {{run.first}} && ${SLURM_ARRAY_TASK_ID} -le {{run.last}} ]]; then
+	export{% for name, value in run.variables.items() %} {{name}}={{value}}{% endfor %}
+	exec /bin/bash "{{run.jobfile}}"
+fi
+{% endfor %}
+
+echo "The array task ${SLURM_ARRAY_TASK_ID} belongs to no run of the campaign {{name}}." >&2
+exit 1
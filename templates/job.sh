@@ -4,20 +4,52 @@
 # Cluster Settings
 
 #SBATCH --job-name='{{project_name}} (PyCluster)'
+{% if shard_size %}
+# The log files are in subdirectories, whose names slurm cannot compute, they are redirected by the script below
+#SBATCH --output=/dev/null
+#SBATCH --error=/dev/null
+{% elif cluster.bundle > 1 %}
+#SBATCH --output={{output_directory}}/{{project_name}}/log/{{project_name}}_bundle-%a.log
+#SBATCH --error={{output_directory}}/{{project_name}}/err/{{project_name}}_bundle-%a.err
+{% else %}
 #SBATCH --output={{output_directory}}/{{project_name}}/log/{{project_name}}_%a.log
 #SBATCH --error={{output_directory}}/{{project_name}}/err/{{project_name}}_%a.err
+{% endif %}
 #SBATCH --mincpus=1
 #SBATCH --ntasks=1
-#SBATCH --cpus-per-task=1
+#SBATCH --cpus-per-task={{cluster.cpus_per_task}}
 #SBATCH --mem-per-cpu={{cluster.max_memory}}
 #SBATCH --partition={{cluster.partition}}
 #SBATCH --mail-type={{cluster.mail}}
 # #SBATCH --mail-user={{user}}@domain.com # change to correct email and remove # in the beginning to receive email notifications
 #SBATCH --time={{cluster.max_time}}
 
-echo "Job number ${SLURM_ARRAY_TASK_ID}"
-then=$(date +'%Y-%m-%d %T')
-echo "Starting job at ${then}."
+# Subdirectory of the input, log and err files of a job{% if shard_size %} (the files are split into subdirectories
+# of {{shard_size}} jobs each){% endif %}
+
+shard() {
+{% if shard_size %}
+	printf '%03d/' $(( $1 / {{shard_size}} ))
+{% else %}
+	:
+{% endif %}
+}
+
+# Arrays larger than the maximum array size are submitted by array position, the job index is offset + position * step
+index=$(( ${PYCLUSTER_INDEX_OFFSET:-0} + SLURM_ARRAY_TASK_ID * ${PYCLUSTER_INDEX_STEP:-1} ))
+{% if shard_size %}
+if [[ -z "${PYCLUSTER_TASK_ID}" ]]; then
+{% else %}
+if [[ -z "${PYCLUSTER_TASK_ID}" && -n "${PYCLUSTER_INDEX_OFFSET}" ]]; then
+{% endif %}
+{% if cluster.bundle > 1 %}
+	exec 1> "{{output_directory}}/{{project_name}}/log/$(shard ${index}){{project_name}}_bundle-${index}.log" \
+		2> "{{output_directory}}/{{project_name}}/err/$(shard ${index}){{project_name}}_bundle-${index}.err"
+{% else %}
+	exec 1> "{{output_directory}}/{{project_name}}/log/$(shard ${index}){{project_name}}_${index}.log" \
+		2> "{{output_directory}}/{{project_name}}/err/$(shard ${index}){{project_name}}_${index}.err"
+{% endif %}
+fi
 
 {% if 'Geant4-example.mac' == inputfile %}
 source /etc/profile.d/modules.sh
@@ -28,9 +60,151 @@ module unload geant4
 module load geant4/10.03
 {% endif %}
 
-# Run executable with input file
-"{{executable}}" "{{output_directory}}/{{project_name}}/inputfiles/{{ inputfile | splitext | first }}-${SLURM_ARRAY_TASK_ID}{{ inputfile | splitext | last }}"
+{% if scratch %}
+# Jobs run in node-local scratch, which is removed when the array task ends (also if it fails or is cancelled)
+mkdir -p "{{scratch.directory}}"
+scratch=$(mktemp -d "{{scratch.directory}}/pycluster.XXXXXX") || exit 1
+trap 'rm -rf "${scratch}"' EXIT
+trap 'exit 143' TERM
+{% elif input_mode == 'runtime' or input_mode == 'pack' %}
+# Input files are provided in node-local scratch
+scratch=$(mktemp -d "${TMPDIR:-/tmp}/pycluster.XXXXXX")
+trap 'rm -rf "${scratch}"' EXIT
+{% endif %}
+
+# Peak memory in kB of the cgroup of this job (cgroup v2), used if /usr/bin/time is not available
+cgroup_peak() {
+	local path=$(sed -n 's/^0:://p' /proc/self/cgroup 2>/dev/null)
+	if [[ -n "${path}" && -r "/sys/fs/cgroup${path}/memory.peak" ]]; then
+		echo $(( $(< "/sys/fs/cgroup${path}/memory.peak") / 1024 ))
+	else
+		echo "-"
+	fi
+}
+
+# Run a single job of the array
+run_task() {
+	local task=$1
+	echo "Job number ${task}"
+	local then=$(date +'%Y-%m-%d %T')
+	echo "Starting job at ${then}."
+
+{% if scratch %}
+	# The job runs in its own working directory in scratch, its outputs are written to output_subdirectories there
+	local workdir="${scratch}/task-${task}"
+	mkdir -p "${workdir}"{% for subdirectory in output_subdirectories | default([]) %} "${workdir}/{{subdirectory}}"{% endfor %}
+
+{% if copy_executable %}
+	cp "{{executable}}" "${workdir}/" || return 1
+	local executable="${workdir}/{{ executable.split('/') | last }}"
+{% else %}
+	local executable="{{executable}}"
+{% endif %}
+{% else %}
+	local executable="{{executable}}"
+{% endif %}
+
+{% if input_mode == 'runtime' or input_mode == 'pack' %}
+	local inputfile="{{ '${workdir}' if scratch else '${scratch}' }}/{{ inputfile | splitext | first }}-${task}{{ inputfile | splitext | last }}"
+{% if input_mode == 'runtime' %}
+	{{pycluster}} render "{{config_filename}}" ${task} --output "${inputfile}" || return 1
+{% else %}
+	{{pycluster}} extract "{{config_filename}}" ${task} --output "${inputfile}" || return 1
+{% endif %}
+{% elif scratch %}
+	local inputfile="${workdir}/{{ inputfile | splitext | first }}-${task}{{ inputfile | splitext | last }}"
+	cp "{{output_directory}}/{{project_name}}/inputfiles/$(shard ${task}){{ inputfile | splitext | first }}-${task}{{ inputfile | splitext | last }}" "${inputfile}" || return 1
+{% else %}
+	local inputfile="{{output_directory}}/{{project_name}}/inputfiles/$(shard ${task}){{ inputfile | splitext | first }}-${task}{{ inputfile | splitext | last }}"
+{% endif %}
+{% if scratch %}
+	local cwd="${PWD}"
+	cd "${workdir}"
+{% endif %}
+
+	# Run executable with input file and record its wall time (s) and peak memory (kB), GNU time can only measure
+	# executables, but not shell builtins (e.g. source)
+	local status walltime maxrss
+	if [[ -x /usr/bin/time && -n "$(type -P "${executable}")" ]]; then
+		local usage=$(mktemp "${TMPDIR:-/tmp}/pycluster-usage.XXXXXX")
+		/usr/bin/time -f '%e %M' -o "${usage}" "${executable}" "${inputfile}"
+		status=$?
+		read walltime maxrss < <(tail -n 1 "${usage}")
+		rm -f "${usage}"
+	else
+		local start=$(date +%s.%N)
+		"${executable}" "${inputfile}"
+		status=$?
+		walltime=$(awk "BEGIN { printf \"%.2f\", $(date +%s.%N) - ${start} }")
+		maxrss=$(cgroup_peak)
+	fi
+	printf '%s\t%s\t%s\t%s\t%s\t%s\n' "${task}" "${SLURM_ARRAY_JOB_ID:-local}" "${walltime}" "${maxrss}" "${status}" \
+		"$(hostname)" >> "{{output_directory}}/{{project_name}}/bash/{{project_name}}.accounting.tsv"
+{% if scratch %}
+	cd "${cwd}"
+{% if output_subdirectories %}
+{% if scratch.archive %}
+
+	# Copy the outputs back as a single archive
+	local archive="{{output_directory}}/{{project_name}}/archive/$(shard ${task}){{project_name}}_${task}.tar"
+	tar -C "${workdir}" -cf "${archive}.part"{% for subdirectory in output_subdirectories %} "{{subdirectory}}"{% endfor %} && \
+		mv "${archive}.part" "${archive}" || status=1
+{% else %}
+
+	# Copy the outputs back in one transfer
+	tar -C "${workdir}" -cf -{% for subdirectory in output_subdirectories %} "{{subdirectory}}"{% endfor %} | \
+		tar -C "{{output_directory}}/{{project_name}}" -xf -
+	[[ ${PIPESTATUS[0]} -eq 0 && ${PIPESTATUS[1]} -eq 0 ]] || status=1
+{% endif %}
+{% endif %}
+	rm -rf "${workdir}"
+{% elif input_mode == 'runtime' or input_mode == 'pack' %}
+	rm -f "${inputfile}"
+{% endif %}
+
+	echo "Started job at ${then}."
+	local now=$(date +'%Y-%m-%d %T')
+	echo "Finished job at ${now}."
+	return ${status}
+}
+
+# Local execution runs single jobs
+if [[ -n "${PYCLUSTER_TASK_ID}" ]]; then
+	run_task ${PYCLUSTER_TASK_ID}
+	exit $?
+fi
 
-echo "Started job at ${then}."
-now=$(date +'%Y-%m-%d %T')
-echo "Finished job at ${now}."
+{% if cluster.bundle > 1 %}
+{% include 'selected.sh' %}
+
+# This array task runs a bundle of {{cluster.bundle}} consecutive jobs, with {{cluster.cpus_per_task}} in parallel
+bundle=${index}
+{% if worker %}
+# The jobs run in persistent python workers, which import their modules only once
+"{{executable}}" "{{pycluster_worker}}" "{{config_filename}}" --bundle ${bundle}
+exit $?
+{% else %}
+numtasks=$(( ({{array.last}} - {{array.first}}) / {{array.step}} + 1 ))
+status=0
+running=0
+for (( position = bundle * {{cluster.bundle}}; position < (bundle + 1) * {{cluster.bundle}} && position < numtasks; position++ )); do
+	i=$(( {{array.first}} + position * {{array.step}} ))
+	selected ${i} || continue
+	if [[ ${running} -ge {{cluster.cpus_per_task}} ]]; then
+		wait -n || status=1
+		running=$((running - 1))
+	fi
+	( run_task ${i} ) 1> "{{output_directory}}/{{project_name}}/log/$(shard ${i}){{project_name}}_${i}.log" \
+		2> "{{output_directory}}/{{project_name}}/err/$(shard ${i}){{project_name}}_${i}.err" &
+	running=$((running + 1))
+done
+while [[ ${running} -gt 0 ]]; do
+	wait -n || status=1
+	running=$((running - 1))
+done
+exit ${status}
+{% endif %}
+{% else %}
+run_task ${index}
+exit $?
+{% endif %}
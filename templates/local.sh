@@ -6,23 +6,35 @@ arrayfirst={{array.first}}
 arraystep={{array.step}}
 arraylast={{array.last}}
 
-echo "   🚀   Started running jobs form index {{array.first}} to index {{array.last}} in steps of {{array.step}}. Running {{cores_local}} jobs in parallel."
+{% include 'selected.sh' %}
 
+if [[ -n "${PYCLUSTER_JOBS}" ]]; then
+	echo "   🚀   Started running the jobs <${PYCLUSTER_JOBS}> of index {{array.first}} to index {{array.last}} in steps of {{array.step}}. Running {{cores_local}} jobs in parallel."
+else
+	echo "   🚀   Started running jobs form index {{array.first}} to index {{array.last}} in steps of {{array.step}}. Running {{cores_local}} jobs in parallel."
+fi
+
+# start a new job as soon as any running job finished
+running=0
 for i in $(seq ${arrayfirst} ${arraystep} ${arraylast});
 do
-	if [[ $((i % (tasksparallel*arraystep))) = 0 ]]; then
-		wait
-		if [[ ${i} -gt 0 ]]; then
-      echo "   🏁   Done running the above jobs."
-    fi
+	selected ${i} || continue
+	if [[ ${running} -ge ${tasksparallel} ]]; then
+		wait -n
+		running=$((running - 1))
 	fi
 	(
-    logfile="{{output_directory}}/{{project_name}}/log/{{project_name}}_${i}.log"
-    errfile="{{output_directory}}/{{project_name}}/err/{{project_name}}_${i}.err"
+		shard={% if shard_size %}$(printf '%03d/' $(( i / {{shard_size}} ))){% endif %}
+
+		logfile="{{output_directory}}/{{project_name}}/log/${shard}{{project_name}}_${i}.log"
+		errfile="{{output_directory}}/{{project_name}}/err/${shard}{{project_name}}_${i}.err"
 		echo "   🏃   Running job with index ${i}."
 		SLURM_ARRAY_TASK_ID=${i}
+		PYCLUSTER_TASK_ID=${i}
 		source "${jobfile}" 1> "${logfile}" 2> "${errfile}"
 	) &
+	running=$((running + 1))
 done
 
 wait
+echo "   🏁   Done running all jobs."
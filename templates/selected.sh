@@ -0,0 +1,16 @@
+# Check if a job is selected by the <jobs> option (given as range expression in PYCLUSTER_JOBS)
+selected() {
+	[[ -z "${PYCLUSTER_JOBS}" ]] && return 0
+	local part range first last step
+	for part in ${PYCLUSTER_JOBS//,/ }; do
+		range=${part%%:*}
+		step=1
+		[[ ${part} == *:* ]] && step=${part##*:}
+		first=${range%%-*}
+		last=${range##*-}
+		if (( $1 >= first && $1 <= last && ($1 - first) % step == 0 )); then
+			return 0
+		fi
+	done
+	return 1
+}